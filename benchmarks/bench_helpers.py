@@ -0,0 +1,176 @@
+"""Throughput and allocation benchmarks for the pure helpers, with a regression gate.
+
+Run from the repository root:
+
+    python benchmarks/bench_helpers.py                    # compare against baseline.json
+    python benchmarks/bench_helpers.py --update-baseline  # record a new baseline
+
+Each case runs its helper over a fixed, realistic input mix. Ops/sec is the
+best of several rounds; allocation is the peak traced memory of one round.
+Raw ops/sec depends on the machine, so every run also times a fixed
+calibration loop and the gate compares each case's ops/sec relative to it.
+The script exits with status 1 when a case's relative speed drops below the
+baseline by more than SPEED_TOLERANCE or it allocates more than
+ALLOC_TOLERANCE above it. Refresh baseline.json with --update-baseline after
+an intended change, on any machine, and commit it.
+"""
+import json
+import logging
+import os
+import random
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+SPEED_TOLERANCE = 0.30  # Fail when ops/sec drops by more than 30%
+ALLOC_TOLERANCE = 0.20  # Fail when peak allocation grows by more than 20%
+ROUNDS = 7
+
+rng = random.Random(1234)
+
+# What users actually type: mostly a handful of round durations, some combined forms
+COMMON_DURATIONS = ['25m', '5m', '1h', '10m', '30m', '15m', '2h', '45m', '1h30m', '50m', '90s', '20m']
+COMBINED_DURATIONS = ['1h30m', '2h15m', '1h5m30s', '3m20s', '12h', '10', ' 5M ', '48h', '1h0m', '1.5h', '2d',
+                      '٢٥ دقيقة', '1 ساعة و 30 دقيقة', '5 minutes']
+GARBAGE_DURATIONS = ['', 'abc', '5x', 'h', '-5m', '0m', '1h2x', '🔥', '5m5m', '99999999999999999999h']
+BOUNDARY_SECONDS = [0, 1, 9, 10, 59, 60, 61, 3599, 3600, 3601, 86399, 86400, main.MAX_TIMER_SECONDS,
+                    main.MAX_TIMER_SECONDS + 1]
+
+DURATION_INPUTS = (
+    rng.choices(COMMON_DURATIONS, k=700) + rng.choices(COMBINED_DURATIONS, k=200) + rng.choices(GARBAGE_DURATIONS, k=100)
+)
+rng.shuffle(DURATION_INPUTS)
+
+# A live timer renders every remaining second; mostly short timers, some long ones
+REMAINING_INPUTS = [rng.randint(0, 25 * 60) for _ in range(800)] + [rng.randint(0, 8 * 3600) for _ in range(200)]
+TOTAL_INPUTS = [rng.choice([300, 1500, 3600, 7200]) for _ in REMAINING_INPUTS]
+VALIDATE_INPUTS = [rng.randint(-10, main.MAX_TIMER_SECONDS + 100) for _ in range(900)] + BOUNDARY_SECONDS * 7
+
+
+def run_calibration():
+    """Plain interpreter work of the same kind as the helpers, independent of main.py"""
+    table = {n: str(n) for n in range(60)}
+    for seconds in REMAINING_INPUTS:
+        minutes, rest = divmod(seconds, 60)
+        f"{table[minutes % 60]}:{rest:02d}".split(':')
+
+
+def run_parse_time():
+    for text in DURATION_INPUTS:
+        try:
+            main.parse_time(text)
+        except ValueError:
+            pass
+
+
+def run_format_time():
+    for seconds in REMAINING_INPUTS:
+        main.format_time(seconds)
+
+
+def run_create_ascii_time():
+    for seconds in REMAINING_INPUTS:
+        main.create_ascii_time(seconds // 60, seconds % 60)
+
+
+def run_create_progress_bar():
+    for current, total in zip(REMAINING_INPUTS, TOTAL_INPUTS):
+        main.create_progress_bar(min(current, total), total)
+
+
+def run_validate_duration():
+    for seconds in VALIDATE_INPUTS:
+        try:
+            main.validate_duration(seconds)
+        except ValueError:
+            pass
+
+
+CASES = {
+    'parse_time': (run_parse_time, len(DURATION_INPUTS)),
+    'format_time': (run_format_time, len(REMAINING_INPUTS)),
+    'create_ascii_time': (run_create_ascii_time, len(REMAINING_INPUTS)),
+    'create_progress_bar': (run_create_progress_bar, len(REMAINING_INPUTS)),
+    'validate_duration': (run_validate_duration, len(VALIDATE_INPUTS)),
+}
+
+
+def peak_allocation(fn):
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def relative_speed(fn, ops):
+    """Best ops/sec of `fn` and of the calibration loop, timed in alternating rounds"""
+    fn()  # Warm the caches, as a running bot would have
+    run_calibration()
+    best, calibration = float('inf'), float('inf')
+    for _ in range(ROUNDS):
+        calibration = min(calibration, timeit.timeit(run_calibration, number=1))
+        best = min(best, timeit.timeit(fn, number=1))
+    return ops / best, len(REMAINING_INPUTS) / calibration
+
+
+def measure():
+    results = {}
+    for name, (fn, ops) in CASES.items():
+        speed, calibration = relative_speed(fn, ops)
+        results[name] = {
+            'ops_per_sec': round(speed),
+            'relative': round(speed / calibration, 3),  # What the gate compares
+            'peak_bytes': peak_allocation(fn)
+        }
+    return results
+
+
+def compare(results, baseline):
+    """Print a table against the baseline and return the names of regressed cases"""
+    regressions = []
+    print(f"{'case':<22}{'ops/sec':>12}{'relative':>10}{'baseline':>10}{'peak B':>10}{'baseline':>10}")
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None or 'relative' not in base:
+            print(f"{name:<22}{result['ops_per_sec']:>12,}{result['relative']:>10.3f}{'-':>10}"
+                  f"{result['peak_bytes']:>10,}{'-':>10}")
+            continue
+        slower = result['relative'] < base['relative'] * (1 - SPEED_TOLERANCE)
+        heavier = result['peak_bytes'] > base['peak_bytes'] * (1 + ALLOC_TOLERANCE) + 1024
+        flag = '  REGRESSION' if slower or heavier else ''
+        print(f"{name:<22}{result['ops_per_sec']:>12,}{result['relative']:>10.3f}{base['relative']:>10.3f}"
+              f"{result['peak_bytes']:>10,}{base['peak_bytes']:>10,}{flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+
+def run(update_baseline=False):
+    logging.disable(logging.CRITICAL)  # parse_time logs every rejected input
+    results = measure()
+
+    if update_baseline or not os.path.exists(BASELINE_PATH):
+        with open(BASELINE_PATH, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        compare(results, {})
+        print(f"baseline written to {BASELINE_PATH}")
+        return 0
+
+    with open(BASELINE_PATH) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline)
+    if regressions:
+        print(f"regressed: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run(update_baseline='--update-baseline' in sys.argv))
@@ -0,0 +1,115 @@
+"""Per-render cost of the timer display, before and after the render kernel.
+
+Run from the repository root:
+
+    python benchmarks/bench_render.py
+
+The `reference_*` functions are the implementations main.py used before the
+render kernel; they are kept here only so the two can be compared.
+"""
+import os
+import sys
+import timeit
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main  # noqa: E402
+
+
+def reference_create_ascii_time(minutes, seconds):
+    time_str = f"{minutes:02d}:{seconds:02d}"
+    lines = ['', '', '', '', '', '']
+    for char in time_str:
+        if char in main.ASCII_NUMBERS:
+            for i, line in enumerate(main.ASCII_NUMBERS[char]):
+                lines[i] += line + ' '
+    return '\n'.join(lines)
+
+
+def reference_create_progress_bar(current, total, length=20):
+    if total <= 0:
+        return "▒" * length + " 0%"
+    filled = int((current / total) * length)
+    filled = max(0, min(filled, length))
+    if current / total > 0.75:
+        fill_char = '🟩'
+    elif current / total > 0.50:
+        fill_char = '🟨'
+    elif current / total > 0.25:
+        fill_char = '🟧'
+    else:
+        fill_char = '🟥'
+    bar = fill_char * filled + '⬜' * (length - filled)
+    percentage = int((current / total) * 100)
+    return f"{bar} {percentage}%"
+
+
+def reference_format_time(seconds):
+    seconds = int(seconds)
+    days = seconds // 86400
+    hours = (seconds % 86400) // 3600
+    minutes = (seconds % 3600) // 60
+    secs = seconds % 60
+    parts = []
+    if days > 0:
+        parts.append(f"{days}ي")
+    if hours > 0:
+        parts.append(f"{hours}س")
+    if minutes > 0:
+        parts.append(f"{minutes}د")
+    if secs > 0 or len(parts) == 0:
+        parts.append(f"{secs}ث")
+    return " ".join(parts)
+
+
+TOTAL = 25 * 60  # A pomodoro-sized timer, rendered every second of its life
+REMAINING = list(range(TOTAL, 0, -1))
+
+
+def render_before():
+    for remaining in REMAINING:
+        f"```\n{reference_create_ascii_time(remaining // 60, remaining % 60)}\n```"
+        reference_create_progress_bar(remaining, TOTAL)
+        reference_format_time(remaining)
+
+
+def render_after():
+    for remaining in REMAINING:
+        main.create_clock_block(remaining)
+        main.create_progress_bar(remaining, TOTAL)
+        main.format_time(remaining)
+
+
+def check_outputs_match():
+    for remaining in REMAINING + [0, 59, 3600, 86400 + 61]:
+        minutes, seconds = remaining // 60, remaining % 60
+        assert main.create_ascii_time(minutes, seconds) == reference_create_ascii_time(minutes, seconds)
+        assert main.create_progress_bar(remaining, TOTAL) == reference_create_progress_bar(remaining, TOTAL)
+        assert main.format_time(remaining) == reference_format_time(remaining)
+
+
+def allocated_bytes(fn):
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak
+
+
+def run():
+    check_outputs_match()
+    render_after()  # Warm the kernel tables, as a running bot would have
+
+    rounds = 20
+    before = min(timeit.repeat(render_before, number=1, repeat=rounds)) / len(REMAINING)
+    after = min(timeit.repeat(render_after, number=1, repeat=rounds)) / len(REMAINING)
+
+    print(f"renders per round:  {len(REMAINING)}")
+    print(f"before:             {before * 1e6:8.2f} us/render   peak {allocated_bytes(render_before):>9,} B")
+    print(f"after (kernel):     {after * 1e6:8.2f} us/render   peak {allocated_bytes(render_after):>9,} B")
+    print(f"speedup:            {before / after:8.1f}x")
+
+
+if __name__ == '__main__':
+    run()
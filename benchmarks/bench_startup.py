@@ -0,0 +1,137 @@
+"""Cold-start benchmark with import-time and time-to-ready budgets.
+
+Run from the repository root:
+
+    python benchmarks/bench_startup.py                 # 1000 stored timers
+    python benchmarks/bench_startup.py --timers 20000
+
+Every round starts a fresh interpreter. "import" is the time to import
+main.py. "ready" runs from interpreter start until the bot has logged in
+against benchmarks/fake_discord.py (setup_hook finished) and restored every
+stored timer; it excludes the gateway handshake, which the fake API does not
+serve. The first round of each kind also pays the command sync, later rounds
+find the command tree unchanged. The best round is compared with
+IMPORT_BUDGET and READY_BUDGET and the script exits with status 1 when
+either is exceeded. Like any wall-clock budget these depend on the machine.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+STARTED = time.perf_counter()
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+IMPORT_BUDGET = 0.5  # Seconds to import main.py
+READY_BUDGET = 1.0  # Seconds from interpreter start to logged in with timers restored
+ROUNDS = 5
+
+
+def seed_timers(main, count):
+    """Store `count` running timers, spread over the next few hours, as a restart would find them"""
+    import sqlite3
+
+    now = time.time()
+    conn = sqlite3.connect(main.DB_PATH)
+    main.init_database(conn)
+    rows = [
+        main.Timer(f"seed{n}", 500000000000000000 + n, 400000000000000000 + n // 500, 300000000000000000 + n // 10,
+                   200000000000000000 + n, now + 60 + (n * 37) % (8 * 3600), 3600, created_at=now - 60,
+                   user_name=f"user{n}").to_row()
+        for n in range(count)
+    ]
+    conn.executemany(
+        f"INSERT INTO scheduled_timers ({main.TIMER_COLUMNS_SQL}) VALUES ({', '.join('?' * len(main.TIMER_COLUMNS))})",
+        rows
+    )
+    conn.commit()
+    conn.close()
+
+
+async def log_in(main, count):
+    import asyncio
+    import discord
+    import fake_discord
+
+    server = fake_discord.FakeDiscord(latency=0)
+    discord.http.Route.BASE = await server.start()
+    await main.bot.login('startup-test-token')
+    logged_in = time.perf_counter() - STARTED
+
+    registry = main.bot.active_timers
+    while len(registry) + registry.parked < count:
+        await asyncio.sleep(0.001)
+    ready = time.perf_counter() - STARTED
+
+    await main.bot.sync_task
+    await main.bot.close()
+    await server.stop()
+    return logged_in, ready
+
+
+def run_child(args):
+    """One cold start; prints the phase timings as JSON"""
+    import asyncio
+
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    os.chdir(args.workdir)
+    os.environ.setdefault('PORT', '0')
+
+    if args.seed:
+        import main
+        seed_timers(main, args.timers)
+        return
+
+    started = time.perf_counter()
+    import main
+    imported = time.perf_counter() - started
+    main.logging.disable(main.logging.WARNING)
+    logged_in, ready = asyncio.run(log_in(main, args.timers))
+    print(json.dumps({'import': imported, 'login': logged_in, 'ready': ready}))
+
+
+def child(*extra):
+    result = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', *extra],
+                            capture_output=True, text=True)
+    if result.returncode:
+        sys.exit(f"startup run failed:\n{result.stderr[-2000:]}")
+    return result.stdout
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix='timerbot-startup-')
+    child('--seed', '--timers', str(args.timers), '--workdir', workdir)
+
+    rounds = [json.loads(child('--timers', str(args.timers), '--workdir', workdir)) for _ in range(args.rounds)]
+    print(f"{'round':<8}{'import s':>10}{'login s':>10}{'ready s':>10}")
+    for n, result in enumerate(rounds, 1):
+        print(f"{n:<8}{result['import']:>10.3f}{result['login']:>10.3f}{result['ready']:>10.3f}")
+
+    best_import = min(result['import'] for result in rounds)
+    best_ready = min(result['ready'] for result in rounds)
+    print(f"best import {best_import:.3f}s (budget {IMPORT_BUDGET}s), "
+          f"ready with {args.timers} timers {best_ready:.3f}s (budget {READY_BUDGET}s)")
+    over = [name for name, value, budget in (('import', best_import, IMPORT_BUDGET), ('ready', best_ready, READY_BUDGET))
+            if value > budget]
+    if over:
+        print(f"over budget: {', '.join(over)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--timers', type=int, default=1000, help="Stored timers to restore")
+    parser.add_argument('--rounds', type=int, default=ROUNDS)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--seed', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--workdir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args)
+    else:
+        sys.exit(run(args))
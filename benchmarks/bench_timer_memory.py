@@ -0,0 +1,114 @@
+"""Memory held per active timer, dict records versus the slotted Timer.
+
+Run from the repository root:
+
+    python benchmarks/bench_timer_memory.py
+
+`reference_timer` builds the dict main.py kept per timer before the Timer
+record, including the PartialMessage it held on to. Timer records are
+rendered once through main.render_timer before measuring, so whatever a
+live timer keeps from its last display edit is counted.
+"""
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main  # noqa: E402
+
+COUNT = 20000
+GUILD_ID = 300000000000000000
+CHANNEL_ID = 400000000000000000
+
+
+def reference_timer(n):
+    now = time.time()
+    return {
+        'user_id': 100000000000000000 + n,
+        'user_name': f"user{n}",
+        'avatar_url': f"https://cdn.discordapp.com/avatars/{n}/a1b2c3d4e5f6.png",
+        'guild_id': GUILD_ID,
+        'channel_id': CHANNEL_ID + n % 100,
+        'message_id': 500000000000000000 + n,
+        'msg': main.timer_message(CHANNEL_ID + n % 100, GUILD_ID, 500000000000000000 + n),
+        'end_time': now + 1500,
+        'total_seconds': 1500,
+        'message': "study",
+        'theme_name': 'dark',
+        'paused': False,
+        'cancelled': False,
+        'pause_time': 0,
+        'created_at': now
+    }
+
+
+def record_timer(n):
+    now = time.time()
+    return main.Timer(
+        main.new_timer_id(),
+        user_id=100000000000000000 + n,
+        guild_id=GUILD_ID,
+        channel_id=CHANNEL_ID + n % 100,
+        message_id=500000000000000000 + n,
+        end_time=now + 1500,
+        total_seconds=1500,
+        message="study",
+        user_name=f"user{n}",
+        avatar_url=f"https://cdn.discordapp.com/avatars/{n}/a1b2c3d4e5f6.png",
+        created_at=now
+    )
+
+
+def fill_dicts():
+    return {f"{100000000000000000 + n}_{n}": reference_timer(n) for n in range(COUNT)}
+
+
+def render_all(timers):
+    """Render every timer once, as its first display edit would, and drop the payloads"""
+    active, main.bot.active_timers = main.bot.active_timers, timers
+    try:
+        for timer_id in timers:
+            if main.render_timer(timer_id) is None:
+                raise RuntimeError(f"timer {timer_id} did not render")
+    finally:
+        main.bot.active_timers = active
+
+
+def fill_records():
+    timers = {timer.id: timer for timer in map(record_timer, range(COUNT))}
+    render_all(timers)
+    return timers
+
+
+def fill_registry():
+    registry = main.TimerRegistry()
+    for n in range(COUNT):
+        registry.add(record_timer(n))
+    render_all(registry)
+    return registry
+
+
+def bytes_held(fill):
+    tracemalloc.start()
+    held = fill()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del held
+    return current
+
+
+def run():
+    before = bytes_held(fill_dicts)
+    records = bytes_held(fill_records)
+    registry = bytes_held(fill_registry)
+
+    print(f"timers:                    {COUNT}")
+    print(f"dict records:              {before / COUNT:8.0f} B/timer")
+    print(f"Timer records:             {records / COUNT:8.0f} B/timer   ({1 - records / before:.0%} less)")
+    print(f"Timer records + indexes:   {registry / COUNT:8.0f} B/timer")
+
+
+if __name__ == '__main__':
+    run()
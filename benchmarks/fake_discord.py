@@ -0,0 +1,193 @@
+"""A local stand-in for the parts of Discord's REST API the bot uses.
+
+Serves login, application info, global and guild command sync, interaction
+callbacks, original-response and followup webhooks, message edits and
+message sends.
+Rate limits follow Discord's shape: every channel has a 5-per-5s bucket for
+edits and another for sends, advertised through X-RateLimit-* headers, and
+the whole bot shares an unadvertised global limit that answers with a
+global 429. There is no gateway; the harness drives interactions directly.
+"""
+import asyncio
+import itertools
+import json
+import time
+from collections import Counter
+
+from aiohttp import web
+
+APPLICATION_ID = 100000000000000001
+BOT_USER = {'id': str(APPLICATION_ID), 'username': 'TimerBot', 'discriminator': '0', 'avatar': None,
+            'global_name': None, 'bot': True}
+
+_snowflakes = itertools.count(200000000000000000)
+
+
+def snowflake():
+    return next(_snowflakes)
+
+
+def message_payload(message_id, channel_id, content='', embeds=None):
+    return {
+        'id': str(message_id), 'channel_id': str(channel_id), 'type': 0, 'content': content,
+        'author': BOT_USER, 'attachments': [], 'embeds': embeds or [], 'mentions': [], 'mention_roles': [],
+        'pinned': False, 'mention_everyone': False, 'tts': False, 'flags': 0, 'components': [],
+        'timestamp': '2024-01-01T00:00:00+00:00', 'edited_timestamp': None
+    }
+
+
+def json_response(data, status=200, headers=None):
+    """JSON body with a bare 'application/json' content type, which is what discord.py checks for"""
+    return web.Response(body=json.dumps(data).encode(), status=status, headers=headers,
+                        content_type='application/json')
+
+
+class Bucket:
+    """Fixed-window limit, reset `per` seconds after its first request"""
+
+    def __init__(self, limit, per):
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def hit(self, now):
+        """Take one request; returns seconds to wait if the bucket is empty"""
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.per
+        if self.remaining <= 0:
+            return self.reset_at - now
+        self.remaining -= 1
+        return 0.0
+
+
+class FakeDiscord:
+    """aiohttp app that mimics the REST routes and counts what it served"""
+
+    MESSAGE_LIMIT = (5, 5.0)  # Per channel, per route
+    GLOBAL_LIMIT = (50, 1.0)
+
+    def __init__(self, latency=0.03):
+        self.latency = latency  # Simulated server time per request
+        self.requests = Counter()  # route -> successful requests
+        self.rate_limited = Counter()  # route -> 429s returned
+        self.rate_limit_times = []  # Monotonic time of every 429 returned
+        self.pings = []  # (monotonic time, content) of every message sent to a channel
+        self._buckets = {}
+        self._global = Bucket(*self.GLOBAL_LIMIT)
+        self._interaction_channels = {}  # token -> channel_id
+        self._runner = None
+        self.url = None
+
+    def app(self):
+        app = web.Application()
+        app.router.add_get('/api/v10/users/@me', self.get_me)
+        app.router.add_get('/api/v10/oauth2/applications/@me', self.application_info)
+        app.router.add_put('/api/v10/applications/{app_id}/commands', self.sync_commands)
+        app.router.add_put('/api/v10/applications/{app_id}/guilds/{guild_id}/commands', self.sync_commands)
+        app.router.add_post('/api/v10/interactions/{interaction_id}/{token}/callback', self.interaction_callback)
+        app.router.add_get('/api/v10/webhooks/{app_id}/{token}/messages/@original', self.original_response)
+        app.router.add_post('/api/v10/webhooks/{app_id}/{token}', self.followup)
+        app.router.add_patch('/api/v10/channels/{channel_id}/messages/{message_id}', self.edit_message)
+        app.router.add_post('/api/v10/channels/{channel_id}/messages', self.send_message)
+        return app
+
+    async def start(self, host='127.0.0.1', port=0):
+        self._runner = web.AppRunner(self.app(), access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}/api/v10"
+        return self.url
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    def register_interaction(self, token, channel_id):
+        self._interaction_channels[token] = channel_id
+
+    async def _limited(self, route, bucket_key, handler, global_limit=True):
+        """Apply the global and per-bucket limits, then run `handler()` for the response"""
+        now = time.monotonic()
+        retry_after = self._global.hit(now) if global_limit else 0.0
+        if retry_after:
+            self.rate_limited['global'] += 1
+            self.rate_limit_times.append(now)
+            return json_response(
+                {'message': 'You are being rate limited.', 'retry_after': retry_after, 'global': True},
+                status=429, headers={'Via': '1.1 google', 'X-RateLimit-Global': 'true', 'X-RateLimit-Scope': 'global'}
+            )
+
+        headers = {'Via': '1.1 google'}
+        if bucket_key is not None:
+            bucket = self._buckets.get(bucket_key)
+            if bucket is None:
+                bucket = self._buckets[bucket_key] = Bucket(*self.MESSAGE_LIMIT)
+            retry_after = bucket.hit(now)
+            headers.update({
+                'X-RateLimit-Limit': str(bucket.limit),
+                'X-RateLimit-Remaining': str(bucket.remaining),
+                'X-RateLimit-Reset-After': f"{max(0.0, bucket.reset_at - now):.3f}",
+                'X-RateLimit-Bucket': bucket_key[0],
+            })
+            if retry_after:
+                self.rate_limited[route] += 1
+                self.rate_limit_times.append(now)
+                headers['X-RateLimit-Scope'] = 'user'
+                return json_response(
+                    {'message': 'You are being rate limited.', 'retry_after': retry_after, 'global': False},
+                    status=429, headers=headers
+                )
+
+        await asyncio.sleep(self.latency)
+        self.requests[route] += 1
+        response = await handler()
+        response.headers.update(headers)
+        return response
+
+    async def get_me(self, request):
+        return json_response(BOT_USER)
+
+    async def application_info(self, request):
+        return json_response({
+            'id': str(APPLICATION_ID), 'name': 'TimerBot', 'description': '', 'icon': None,
+            'bot_public': True, 'bot_require_code_grant': False, 'owner': BOT_USER, 'verify_key': '0' * 64,
+            'flags': 0
+        })
+
+    async def sync_commands(self, request):
+        return json_response([])
+
+    async def interaction_callback(self, request):
+        async def respond():
+            return web.Response(status=204)
+        # Interaction responses are not counted against the bot's global limit
+        return await self._limited('POST /interactions/{id}/{token}/callback', None, respond, global_limit=False)
+
+    async def original_response(self, request):
+        channel_id = self._interaction_channels.get(request.match_info['token'], 0)
+        return json_response(message_payload(snowflake(), channel_id))
+
+    async def followup(self, request):
+        channel_id = self._interaction_channels.get(request.match_info['token'], 0)
+        return json_response(message_payload(snowflake(), channel_id))
+
+    async def edit_message(self, request):
+        channel_id = int(request.match_info['channel_id'])
+        message_id = int(request.match_info['message_id'])
+
+        async def respond():
+            return json_response(message_payload(message_id, channel_id))
+        return await self._limited('PATCH /channels/{id}/messages/{id}', ('edit', channel_id), respond)
+
+    async def send_message(self, request):
+        channel_id = int(request.match_info['channel_id'])
+
+        async def respond():
+            payload = await request.json()
+            self.pings.append((time.monotonic(), payload.get('content', '')))
+            return json_response(message_payload(snowflake(), channel_id, payload.get('content', '')))
+        return await self._limited('POST /channels/{id}/messages', ('send', channel_id), respond)
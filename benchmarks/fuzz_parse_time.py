@@ -0,0 +1,153 @@
+"""Fuzz and throughput check for parse_time.
+
+Run from the repository root:
+
+    python benchmarks/fuzz_parse_time.py                # 20000 cases per kind
+    python benchmarks/fuzz_parse_time.py --cases 200000 --seed 7
+
+Valid durations are built from random tokens (every unit spelling, Latin,
+Arabic-Indic and Persian digits, decimals, joiners and spacing) and must
+parse to the seconds they were built from. Each one is then mutated into
+something ambiguous (a repeated or out-of-order unit, a stray letter, a
+dangling number) that must be rejected. Random strings may parse or not,
+but may only ever fail with ValueError. Throughput is reported for cold
+(uncached) and warm (cached) calls. The script exits with status 1 when
+any case fails.
+"""
+import argparse
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import main  # noqa: E402
+
+UNIT_WORDS = {}
+for word, seconds in main.DURATION_UNITS.items():
+    UNIT_WORDS.setdefault(seconds, []).append(word)
+UNITS = sorted(UNIT_WORDS, reverse=True)
+
+DIGIT_SETS = ('0123456789', '٠١٢٣٤٥٦٧٨٩', '۰۱۲۳۴۵۶۷۸۹')
+JOINERS = ('', ' ', ' و ', ' و', ' and ', ', ')  # 'و' straight after a unit word reads as part of it
+ALPHABET = '0123456789.dhms ,و٠١٢٥٫ساعةدقيقثx-+:🔥'
+
+
+def spell(number, digits):
+    return ''.join(digits[int(char)] if char.isdigit() else char for char in number)
+
+
+def valid_case(rng):
+    """A random well-formed duration and the seconds it stands for"""
+    digits = rng.choice(DIGIT_SETS)
+    units = sorted(rng.sample(UNITS, rng.randint(1, len(UNITS))), reverse=True)
+    tokens, tenths = [], 0
+    for unit in units:
+        value = rng.randint(1, 90)
+        number = str(value)
+        if rng.random() < 0.2:
+            number += f".{rng.randint(0, 9)}"
+        tenths += int(round(float(number) * 10)) * unit
+        number = spell(number, digits)
+        if number[-2:-1] == '.' and digits != DIGIT_SETS[0] and rng.random() < 0.5:
+            number = number.replace('.', '٫')
+        word = rng.choice(UNIT_WORDS[unit])
+        if word.isascii() and rng.random() < 0.2:
+            word = word.upper()
+        tokens.append(number + rng.choice(['', ' ']) + word)
+    text = tokens[0]
+    for token in tokens[1:]:
+        text += rng.choice(JOINERS) + token
+    return rng.choice(['', ' ']) + text + rng.choice(['', ' ']), (tenths + 5) // 10
+
+
+def invalid_variant(rng, text):
+    """Turn a valid duration into an ambiguous one"""
+    kind = rng.randrange(4)
+    if kind == 0:
+        return f"{text} {text.strip()}"  # Every unit appears twice
+    if kind == 1:
+        return f"{text.strip()}x"  # Unknown unit letter
+    if kind == 2:
+        return f"{text.strip()} 5"  # Trailing bare number
+    return f"5q{text.strip()}"  # Unknown unit before everything else
+
+
+def check(cases, seed):
+    rng = random.Random(seed)
+    failures = 0
+
+    for _ in range(cases):
+        text, expected = valid_case(rng)
+        try:
+            got = main.parse_time(text)
+        except ValueError:
+            got = 'ValueError'
+        if got != expected:
+            print(f"valid {text!r}: expected {expected}, got {got}")
+            failures += 1
+
+        bad = invalid_variant(rng, text)
+        try:
+            got = main.parse_time(bad)
+        except ValueError:
+            continue
+        print(f"ambiguous {bad!r}: expected ValueError, got {got}")
+        failures += 1
+
+    for _ in range(cases):
+        text = ''.join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 12)))
+        try:
+            got = main.parse_time(text)
+        except ValueError:
+            continue
+        except Exception as e:
+            print(f"random {text!r}: raised {type(e).__name__}: {e}")
+            failures += 1
+            continue
+        if not isinstance(got, int) or got <= 0:
+            print(f"random {text!r}: returned {got!r}")
+            failures += 1
+
+    return failures
+
+
+def throughput(inputs):
+    main._parse_duration.cache_clear()
+    started = time.perf_counter()
+    for text in inputs:
+        main._parse_duration.__wrapped__(text)
+    cold = len(inputs) / (time.perf_counter() - started)
+
+    for text in inputs:
+        main.parse_time(text)
+    started = time.perf_counter()
+    for text in inputs:
+        main.parse_time(text)
+    warm = len(inputs) / (time.perf_counter() - started)
+    return cold, warm
+
+
+def run(cases, seed):
+    logging.disable(logging.CRITICAL)  # parse_time logs every rejected input
+    failures = check(cases, seed)
+    print(f"fuzz: {cases} valid, {cases} ambiguous, {cases} random inputs, {failures} failures")
+
+    rng = random.Random(seed)
+    common = rng.choices(['25m', '5m', '1h', '10m', '30m', '15m', '2h', '45m', '1h30m', '50m'], k=10000)
+    cold, warm = throughput(common)
+    print(f"common durations: {cold:,.0f} ops/sec uncached, {warm:,.0f} ops/sec cached")
+    mixed = [valid_case(rng)[0] for _ in range(10000)]
+    cold, _ = throughput(mixed)
+    print(f"generated durations: {cold:,.0f} ops/sec uncached")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cases', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    sys.exit(run(args.cases, args.seed))
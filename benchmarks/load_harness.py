@@ -0,0 +1,249 @@
+"""End-to-end load test of the bot against a local fake Discord REST API.
+
+Run from the repository root:
+
+    python benchmarks/load_harness.py                        # 100, 1000 and 5000 timers
+    python benchmarks/load_harness.py --scales 200,2000 --duration 90
+
+Each scale runs in a fresh process with its own temporary database. The bot
+logs in against benchmarks/fake_discord.py (discord.http.Route.BASE is
+pointed at it), so setup_hook, the scheduler, the renderer and completions
+all run unmodified. Timers are created through the real /timer handler and a
+share of them get pause/resume, +5 min and cancel presses through the real
+buttons. There is no gateway connection, so gateway-only features (message
+delete events, presence) are not exercised.
+
+The completion phase runs from the first completion ping to the end of the
+run. Pings and final edits must fit Discord's limits there too, so the
+script exits with status 1 when any scale gets more than COMPLETION_429_BUDGET
+429s in that phase or a completion ping goes missing.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import fake_discord  # noqa: E402
+
+TIMERS_PER_CHANNEL = 10
+CHANNELS_PER_GUILD = 50
+BUTTON_SHARE = 0.05  # Share of timers that get button presses
+COMPLETION_429_BUDGET = 0  # 429s allowed once timers start finishing
+
+
+def interaction_payload(server, kind, user_id, guild_id, channel_id, data):
+    token = f"token{fake_discord.snowflake()}"
+    server.register_interaction(token, channel_id)
+    return {
+        'id': str(fake_discord.snowflake()), 'application_id': str(fake_discord.APPLICATION_ID), 'type': kind,
+        'token': token,
+        'version': 1, 'guild_id': str(guild_id), 'data': data, 'locale': 'ar',
+        'channel': {
+            'id': str(channel_id), 'type': 0, 'name': 'study', 'position': 0, 'guild_id': str(guild_id),
+            'permission_overwrites': [], 'nsfw': False, 'parent_id': None, 'rate_limit_per_user': 0, 'flags': 0
+        },
+        'member': {
+            'user': {'id': str(user_id), 'username': f"user{user_id}", 'discriminator': '0', 'avatar': None,
+                     'global_name': None},
+            'roles': [], 'joined_at': '2024-01-01T00:00:00+00:00', 'deaf': False, 'mute': False, 'flags': 0,
+            'permissions': '0'
+        }
+    }
+
+
+def percentile(histogram, q):
+    """Upper bucket bound below which a share `q` of the observations fall"""
+    series = histogram._series.get(None)
+    if not series:
+        return None
+    total = sum(series[:-1])
+    seen = 0
+    for bound, count in zip(histogram.buckets + (float('inf'),), series):
+        seen += count
+        if seen >= q * total:
+            return bound
+    return float('inf')
+
+
+def rss_mb():
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def drained(main):
+    """No running timers and nothing left to send: completions, pings and edits are all out"""
+    renderer = main.bot.renderer
+    return not (main.bot.active_timers or main.bot.completions._pending or renderer._sends or renderer._sending
+                or renderer._inflight or any(renderer._queues.values()))
+
+
+async def press(main, server, timer_id, action):
+    timer = main.bot.active_timers.get(timer_id)
+    if timer is None:
+        return
+    payload = interaction_payload(server, 3, timer.user_id, timer.guild_id, timer.channel_id,
+                                  {'custom_id': f"timer:{action}:{timer_id}", 'component_type': 2})
+    interaction = main.discord.Interaction(data=payload, state=main.bot._connection)
+    await main.TimerButton(action, timer_id).callback(interaction)
+
+
+async def exercise_buttons(main, server, timer_ids, rng):
+    """Pause and resume, extend or cancel a share of the timers while they run"""
+    await asyncio.sleep(5)
+    for timer_id in timer_ids:
+        roll = rng.random()
+        if roll < 0.5:
+            await press(main, server, timer_id, 'pause')
+            asyncio.get_running_loop().call_later(
+                3, lambda timer_id=timer_id: asyncio.ensure_future(press(main, server, timer_id, 'resume'))
+            )
+        elif roll < 0.8:
+            await press(main, server, timer_id, 'extend')
+        else:
+            await press(main, server, timer_id, 'cancel')
+
+
+async def run_scale(timers, duration, seed):
+    import discord
+
+    server = fake_discord.FakeDiscord()
+    discord.http.Route.BASE = await server.start()
+
+    import main
+    main.logger.setLevel('WARNING')
+    main.logging.getLogger('discord').setLevel('ERROR')
+    main.logging.getLogger('discord.http').setLevel('WARNING')  # RateLimitWatcher needs these
+
+    await main.bot.login('load-test-token')
+    rng = random.Random(seed)
+    rss_before = rss_mb()
+
+    # Create every timer through the real /timer handler
+    started = time.monotonic()
+    edits_before = server.requests['PATCH /channels/{id}/messages/{id}']
+    for start in range(0, timers, 200):
+        batch = []
+        for n in range(start, min(start + 200, timers)):
+            channel_id = 300000000000000000 + n // TIMERS_PER_CHANNEL
+            guild_id = 400000000000000000 + n // (TIMERS_PER_CHANNEL * CHANNELS_PER_GUILD)
+            seconds = rng.randint(20, max(21, duration - 15))
+            payload = interaction_payload(server, 2, 500000000000000000 + n, guild_id, channel_id,
+                                          {'id': '1', 'name': 'timer', 'type': 1})
+            interaction = discord.Interaction(data=payload, state=main.bot._connection)
+            batch.append(main.timer_command.callback(interaction, f"{seconds}s", None))
+        await asyncio.gather(*batch)
+    create_seconds = time.monotonic() - started
+    created = list(main.bot.active_timers)
+
+    pressed = rng.sample(created, int(len(created) * BUTTON_SHARE))
+    buttons = asyncio.create_task(exercise_buttons(main, server, pressed, rng))
+
+    # Let the timers run out while sampling loop lag and memory
+    lags, peak_rss = [], rss_mb()
+    run_started = time.monotonic()
+    while time.monotonic() - run_started < duration + 30:
+        await asyncio.sleep(1)
+        lags.append(main.bot.loop_lag.lag)
+        peak_rss = max(peak_rss, rss_mb())
+        if drained(main) and run_started + 10 < time.monotonic():
+            break
+    elapsed = time.monotonic() - started
+    buttons.cancel()
+
+    edits = server.requests['PATCH /channels/{id}/messages/{id}'] - edits_before
+    served = sum(server.requests.values())
+    limited = sum(server.rate_limited.values())
+    first_ping = server.pings[0][0] if server.pings else float('inf')
+    pinged = sum(content.count('<@') for _, content in server.pings)
+    result = {
+        'timers': timers,
+        'create_per_sec': round(timers / create_seconds),
+        'edits_per_sec': round(edits / elapsed, 1),
+        'rate_limited_pct': round(100 * limited / max(1, served + limited), 2),
+        'completion_429s': sum(1 for at in server.rate_limit_times if at >= first_ping),
+        'completions': main.bot.completions.completed,
+        'missed_pings': main.bot.completions.completed + main.bot.completions.phases - pinged,
+        'left_running': len(main.bot.active_timers),
+        'completion_lateness_p50': percentile(main.completion_lateness_seconds, 0.5),
+        'completion_lateness_p95': percentile(main.completion_lateness_seconds, 0.95),
+        'scheduler_lateness_p95': percentile(main.scheduler_lateness_seconds, 0.95),
+        'loop_lag_ms_mean': round(1000 * sum(lags) / max(1, len(lags)), 1),
+        'loop_lag_ms_max': round(1000 * max(lags, default=0), 1),
+        'rss_mb': round(peak_rss, 1),
+        'rss_growth_mb': round(peak_rss - rss_before, 1),
+    }
+
+    await main.bot.close()
+    await server.stop()
+    return result
+
+
+def run_child(args):
+    os.chdir(tempfile.mkdtemp(prefix='timerbot-load-'))  # Fresh timer_bot.db per scale
+    os.environ.setdefault('PORT', '0')
+    os.environ.setdefault('MAX_TIMERS_PER_GUILD', str(TIMERS_PER_CHANNEL * CHANNELS_PER_GUILD))
+    os.environ.setdefault('HISTORY_ARCHIVE_DIR', '')
+    result = asyncio.run(run_scale(args.timers, args.duration, args.seed))
+    print(json.dumps(result))
+
+
+COLUMNS = (
+    ('timers', 'timers'), ('create_per_sec', 'create/s'), ('edits_per_sec', 'edits/s'),
+    ('rate_limited_pct', '429 %'), ('completion_429s', 'done 429s'), ('completions', 'done'),
+    ('missed_pings', 'no ping'), ('left_running', 'left'),
+    ('completion_lateness_p50', 'late p50 s'), ('completion_lateness_p95', 'late p95 s'),
+    ('scheduler_lateness_p95', 'sched p95 s'), ('loop_lag_ms_mean', 'lag ms'), ('loop_lag_ms_max', 'lag max'),
+    ('rss_mb', 'RSS MB'), ('rss_growth_mb', 'RSS +MB'),
+)
+
+
+def run(args):
+    print('  '.join(f"{title:>11}" for _, title in COLUMNS))
+    failed = []
+    for timers in args.scales:
+        child = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child', '--timers', str(timers),
+             '--duration', str(args.duration), '--seed', str(args.seed)],
+            capture_output=True, text=True
+        )
+        lines = child.stdout.strip().splitlines()
+        if child.returncode or not lines:
+            print(f"{timers:>11}  failed:\n{child.stderr[-2000:]}")
+            failed.append(timers)
+            continue
+        result = json.loads(lines[-1])
+        print('  '.join(f"{str(result[key]):>11}" for key, _ in COLUMNS))
+        if result['completion_429s'] > COMPLETION_429_BUDGET or result['missed_pings']:
+            failed.append(timers)
+
+    if failed:
+        print(f"completion phase over budget or missing pings at: {', '.join(map(str, failed))} timers")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', type=lambda text: [int(n) for n in text.split(',')], default=[100, 1000, 5000])
+    parser.add_argument('--duration', type=int, default=60, help="Longest timer, in seconds")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--timers', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args)
+    else:
+        sys.exit(run(args))
@@ -1,15 +1,24 @@
 import discord
-from discord.ext import commands
 from discord import app_commands
 import os
+import sys
 import asyncio
+import bisect
+import functools
+import hashlib
+import heapq
+import itertools
+import random
+import re
 import time
 from datetime import datetime, timedelta
 import threading
 import traceback
-from flask import Flask
+import gzip
 import json
+import queue
 import sqlite3
+from collections import Counter, OrderedDict, deque
 from pathlib import Path
 
 # --------- LOGGING ---------
@@ -20,13 +29,133 @@ logging.basicConfig(
 )
 logger = logging.getLogger('TimerBot')
 
+# --------- METRICS ---------
+class Histogram:
+    """Prometheus-style histogram with fixed buckets and an optional label.
+
+    observe() is a bisect and two additions, cheap enough for every edit,
+    scheduler wakeup and query.
+    """
+
+    def __init__(self, name, help_text, buckets, label=None):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(buckets)
+        self.label = label
+        self._series = {}  # label value -> [bucket counts..., +Inf count, sum]
+
+    def observe(self, value, label_value=None):
+        series = self._series.get(label_value)
+        if series is None:
+            series = self._series[label_value] = [0] * (len(self.buckets) + 2)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def expose(self, lines):
+        """Append the histogram in Prometheus text format"""
+        lines.append(f"# HELP {self.name} {self.help_text}")
+        lines.append(f"# TYPE {self.name} histogram")
+        for label_value, series in list(self._series.items()):
+            labels = f'{self.label}="{label_value}",' if self.label else ''
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels}le="{bound}"}} {cumulative}')
+            labels = labels.rstrip(',')
+            suffix = f"{{{labels}}}" if labels else ''
+            lines.append(f"{self.name}_sum{suffix} {series[-1]}")
+            lines.append(f"{self.name}_count{suffix} {cumulative}")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+edit_seconds = Histogram(
+    "timerbot_edit_seconds", "Round-trip time of message edits", LATENCY_BUCKETS
+)
+scheduler_lateness_seconds = Histogram(
+    "timerbot_scheduler_lateness_seconds", "How late timer events ran after their due time",
+    (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+completion_lateness_seconds = Histogram(
+    "timerbot_completion_lateness_seconds", "Time from a timer's end to its completion ping",
+    (0.1, 0.25, 0.5, 1, 2, 5, 10, 30, 60)
+)
+db_seconds = Histogram(
+    "timerbot_db_seconds", "Database read and group-commit durations",
+    (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.5, 1), label='kind'
+)
+command_seconds = Histogram(
+    "timerbot_command_seconds", "Slash command and button handler durations", LATENCY_BUCKETS, label='command'
+)
+HISTOGRAMS = (edit_seconds, scheduler_lateness_seconds, completion_lateness_seconds, db_seconds, command_seconds)
+
+def timed(name):
+    """Record the duration of an async handler in command_seconds"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                command_seconds.observe(time.perf_counter() - started, name)
+        return wrapper
+    return decorator
+
 # --------- DATABASE SETUP ---------
 DB_PATH = Path('timer_bot.db')
 
-def init_database():
+# --------- TIMER LIMITS ---------
+MAX_TIMER_SECONDS = int(os.environ.get("TIMER_MAX_SECONDS", 7 * 86400))  # Max 7 days
+LIVE_WINDOW = int(os.environ.get("TIMER_LIVE_WINDOW", 3600))  # Timers further out are not re-rendered
+MEMORY_HORIZON = int(os.environ.get("TIMER_MEMORY_HORIZON", 6 * 3600))  # Timers further out live only in SQLite
+MAX_TIMERS_PER_USER = int(os.environ.get("MAX_TIMERS_PER_USER", 10))  # Active and scheduled timers per user
+MAX_TIMERS_PER_GUILD = int(os.environ.get("MAX_TIMERS_PER_GUILD", 500))  # Active and scheduled timers per server
+MAX_CYCLE_ROUNDS = int(os.environ.get("MAX_CYCLE_ROUNDS", 24))  # Work rounds or repetitions of one recurring timer
+
+def add_missing_columns(cursor, table, columns):
+    """Add columns introduced after a table was first created"""
+    existing = {row[1] for row in cursor.execute(f'PRAGMA table_info({table})')}
+    for name, definition in columns.items():
+        if name not in existing:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+
+def user_stats_source(where=''):
+    """Per-user totals from the raw history plus the daily rollups of pruned rows"""
+    return f'''
+        SELECT user_id, SUM(total), SUM(completed), SUM(total_duration) FROM (
+            SELECT user_id, COUNT(*) AS total, SUM(CASE WHEN completed THEN 1 ELSE 0 END) AS completed,
+                   COALESCE(SUM(duration), 0) AS total_duration
+            FROM timer_history {where} GROUP BY user_id
+            UNION ALL
+            SELECT user_id, total, completed, total_duration FROM timer_history_daily {where}
+        ) GROUP BY user_id
+    '''
+
+def rebuild_user_stats(cursor, user_ids=None):
+    """Recompute user_stats from the history, for everyone or for `user_ids`"""
+    if user_ids is None:
+        cursor.execute('DELETE FROM user_stats')
+        cursor.execute(f'INSERT INTO user_stats (user_id, total, completed, total_duration) {user_stats_source()}')
+        return
+    for user_id in user_ids:
+        cursor.execute('DELETE FROM user_stats WHERE user_id = ?', (user_id,))
+        cursor.execute(
+            f'INSERT INTO user_stats (user_id, total, completed, total_duration) {user_stats_source("WHERE user_id = :user_id")}',
+            {'user_id': user_id}
+        )
+
+def find_user_stats_mismatches(cursor):
+    """User IDs whose user_stats row disagrees with timer_history and its rollups"""
+    expected = {row[0]: row[1:] for row in cursor.execute(user_stats_source())}
+    actual = {row[0]: row[1:] for row in cursor.execute('SELECT user_id, total, completed, total_duration FROM user_stats')}
+    return sorted(
+        user_id for user_id in expected.keys() | actual.keys()
+        if expected.get(user_id, (0, 0, 0)) != actual.get(user_id, (0, 0, 0))
+    )
+
+def init_database(conn):
     """Initialize SQLite database"""
     try:
-        conn = sqlite3.connect(DB_PATH)
         cursor = conn.cursor()
         
         # User themes table
@@ -37,6 +166,9 @@ def init_database():
                 updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        add_missing_columns(cursor, 'user_themes', {
+            'display_mode': "TEXT DEFAULT 'live'"
+        })
         
         # Timer history table (optional - for statistics)
         cursor.execute('''
@@ -50,83 +182,783 @@ def init_database():
             )
         ''')
         
-        conn.commit()
-        conn.close()
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_timer_history_created_at ON timer_history (created_at)')
+        
+        # Daily per-user summaries of history rows past the retention window
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS timer_history_daily (
+                user_id INTEGER NOT NULL,
+                day TEXT NOT NULL,
+                total INTEGER NOT NULL DEFAULT 0,
+                completed INTEGER NOT NULL DEFAULT 0,
+                total_duration INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (user_id, day)
+            )
+        ''')
+        
+        # Per-user aggregates of timer_history, kept in step with every insert
+        backfill_stats = not cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'user_stats'"
+        ).fetchone()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS user_stats (
+                user_id INTEGER PRIMARY KEY,
+                total INTEGER NOT NULL DEFAULT 0,
+                completed INTEGER NOT NULL DEFAULT 0,
+                total_duration INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        if backfill_stats:
+            rebuild_user_stats(cursor)
+            logger.info("📊 Backfilled user_stats from timer_history")
+        
+        # Durable copy of every running timer; far-future ones live only here
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS scheduled_timers (
+                id TEXT PRIMARY KEY,
+                user_id INTEGER,
+                channel_id INTEGER,
+                message_id INTEGER,
+                end_time REAL,
+                total_seconds INTEGER,
+                message TEXT,
+                theme_name TEXT,
+                created_at REAL
+            )
+        ''')
+        add_missing_columns(cursor, 'scheduled_timers', {
+            'guild_id': 'INTEGER',
+            'paused': 'BOOLEAN DEFAULT 0',
+            'pause_time': 'REAL DEFAULT 0',
+            'user_name': 'TEXT',
+            'avatar_url': 'TEXT',
+            'display_mode': "TEXT DEFAULT 'live'",
+            'cycle_work': 'INTEGER DEFAULT 0',
+            'cycle_rest': 'INTEGER DEFAULT 0',
+            'cycle_rounds': 'INTEGER DEFAULT 0',
+            'cycle_phase': 'INTEGER DEFAULT 0'
+        })
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_scheduled_timers_end_time ON scheduled_timers (end_time)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_scheduled_timers_user_id ON scheduled_timers (user_id)')
+        
+        # Single row rewritten by /health to prove the database accepts writes
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS health_check (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                checked_at REAL
+            )
+        ''')
+        
+        # Hash of the command tree last pushed to Discord, per scope ('global' or 'guild:<id>')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS command_sync (
+                scope TEXT PRIMARY KEY,
+                tree_hash TEXT NOT NULL,
+                synced_at REAL
+            )
+        ''')
+        
         logger.info("✅ Database initialized successfully")
     except Exception as e:
         logger.error(f"❌ Database initialization error: {e}")
 
-init_database()
+# --------- DATABASE ---------
+def _resolve_future(future, result=None, error=None):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+class Database:
+    """SQLite access through one long-lived WAL connection on a dedicated thread.
+
+    Every call returns an awaitable, so a slow disk never blocks the event loop.
+    Writes are queued and flushed in group commits: everything that arrives
+    within COMMIT_DELAY of the first pending write shares one transaction, and
+    each write runs in its own savepoint so a failing one does not sink the rest.
+    """
+
+    COMMIT_DELAY = 0.005
+    MAX_BATCH = 500
+
+    def __init__(self, path):
+        self.path = path
+        self._jobs = queue.SimpleQueue()
+        self._thread = None
+        self._loop = None
+        self.commits = 0
+        self.writes = 0
+
+    async def start(self):
+        if self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        ready = self._loop.create_future()
+        self._thread = threading.Thread(target=self._worker, args=(ready,), name='TimerBotDB', daemon=True)
+        self._thread.start()
+        await ready
+
+    async def close(self):
+        """Flush pending writes and close the connection"""
+        if self._thread is None:
+            return
+        self._jobs.put(None)
+        await asyncio.to_thread(self._thread.join)
+        self._thread = None
+
+    def write(self, fn):
+        """Queue `fn(conn)` as a write; the future resolves to its result (None on error) after commit"""
+        future = asyncio.get_running_loop().create_future()
+        self._jobs.put((True, fn, future))
+        return future
+
+    def read(self, fn):
+        """Run `fn(conn)` on the database thread and return a future for its result"""
+        future = asyncio.get_running_loop().create_future()
+        self._jobs.put((False, fn, future))
+        return future
+
+    def execute(self, sql, params=()):
+        return self.write(lambda conn: conn.execute(sql, params).rowcount)
+
+    def executemany(self, sql, seq_of_params):
+        return self.write(lambda conn: conn.executemany(sql, seq_of_params).rowcount)
+
+    def fetchone(self, sql, params=()):
+        return self.read(lambda conn: conn.execute(sql, params).fetchone())
+
+    def fetchall(self, sql, params=()):
+        return self.read(lambda conn: conn.execute(sql, params).fetchall())
+
+    def _resolve(self, future, result=None, error=None):
+        try:
+            self._loop.call_soon_threadsafe(_resolve_future, future, result, error)
+        except RuntimeError:
+            pass  # Event loop already closed
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')  # Applies to a new database as is
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA busy_timeout=5000')
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] != 2:
+            # An existing database only switches modes when rebuilt, once
+            started = time.perf_counter()
+            try:
+                conn.execute('VACUUM')
+                logger.info(f"🗄️ Database converted to incremental auto-vacuum in {time.perf_counter() - started:.2f}s")
+            except Exception as e:
+                logger.error(f"Could not convert database to incremental auto-vacuum: {e}")
+        init_database(conn)
+        return conn
+
+    def _worker(self, ready):
+        try:
+            conn = self._connect()
+        except Exception as e:
+            logger.error(f"❌ Could not open database: {e}")
+            self._resolve(ready, error=e)
+            return
+        self._resolve(ready, True)
+
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            if job[0]:
+                if not self._commit_batch(conn, job):
+                    break
+            else:
+                self._run_read(conn, job)
+
+        conn.close()
+        logger.info("🗄️ Database connection closed")
+
+    def _run_read(self, conn, job):
+        _, fn, future = job
+        started = time.perf_counter()
+        try:
+            self._resolve(future, fn(conn))
+        except Exception as e:
+            self._resolve(future, error=e)
+        db_seconds.observe(time.perf_counter() - started, 'read')
+
+    def _commit_batch(self, conn, first):
+        """Run a group of writes in one transaction; returns False when asked to stop"""
+        batch, reads, keep_running = [first], [], True
+        deadline = time.monotonic() + self.COMMIT_DELAY
+        while len(batch) < self.MAX_BATCH:
+            try:
+                job = self._jobs.get(timeout=max(0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if job is None:
+                keep_running = False
+                break
+            (batch if job[0] else reads).append(job)
+
+        results = []
+        started = time.perf_counter()
+        try:
+            conn.execute('BEGIN')
+            for _, fn, _ in batch:
+                conn.execute('SAVEPOINT job')
+                try:
+                    results.append(fn(conn))
+                    conn.execute('RELEASE job')
+                except Exception as e:
+                    logger.error(f"Database write failed: {e}")
+                    conn.execute('ROLLBACK TO job')
+                    conn.execute('RELEASE job')
+                    results.append(None)
+            conn.execute('COMMIT')
+            self.commits += 1
+            self.writes += len(batch)
+            db_seconds.observe(time.perf_counter() - started, 'commit')
+        except Exception as e:
+            logger.error(f"Database commit failed: {e}")
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            results = [None] * len(batch)
+
+        for (_, _, future), result in zip(batch, results):
+            self._resolve(future, result)
+
+        # Reads queued behind these writes see them
+        for job in reads:
+            self._run_read(conn, job)
+        return keep_running
+
+db = Database(DB_PATH)
+
+# --------- CACHES ---------
+class LRUCache:
+    """Bounded LRU cache with an optional TTL and hit/miss counters.
+
+    set() stores a new value and bumps the key's version; fill() stores a value
+    loaded after a miss only if no set() happened while it was being loaded.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (value, expires_at)
+        self._versions = OrderedDict()  # key -> number of set() calls, for the most recently set keys
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        item = self._data.get(key)
+        if item is None or (item[1] is not None and item[1] < time.monotonic()):
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return item[0]
+
+    def version(self, key):
+        """Version of `key` to hand back to fill() once a slow lookup returns"""
+        return self._versions.get(key, 0)
+
+    def set(self, key, value):
+        self._versions[key] = self._versions.get(key, 0) + 1
+        self._versions.move_to_end(key)
+        if len(self._versions) > self.maxsize:
+            self._versions.popitem(last=False)
+        self._store(key, value)
+
+    def fill(self, key, value, version):
+        """Store a value read from the database unless set() replaced it since `version`"""
+        if self._versions.get(key, 0) == version:
+            self._store(key, value)
+
+    def _store(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        self._data.pop(key, None)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0
+        }
+
+# Themes change about once a month, so they are served from memory
+theme_cache = LRUCache(
+    maxsize=int(os.environ.get("THEME_CACHE_SIZE", 50000)),
+    ttl=int(os.environ.get("THEME_CACHE_TTL", 6 * 3600))
+)
+THEME_CACHE_PREWARM = int(os.environ.get("THEME_CACHE_PREWARM", 1000))
+
+# Display modes are per-user preferences like themes and are cached the same way
+display_cache = LRUCache(maxsize=theme_cache.maxsize, ttl=theme_cache.ttl)
 
 # --------- DATABASE HELPERS ---------
-def get_user_theme(user_id):
-    """Get user theme from database"""
+async def get_user_theme(user_id):
+    """Get user theme from the cache, falling back to the database"""
+    theme_name = theme_cache.get(user_id)
+    if theme_name is not None:
+        return theme_name
+    
+    version = theme_cache.version(user_id)
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('SELECT theme_name FROM user_themes WHERE user_id = ?', (user_id,))
-        result = cursor.fetchone()
-        conn.close()
-        return result[0] if result else 'dark'
+        result = await db.fetchone('SELECT theme_name FROM user_themes WHERE user_id = ?', (user_id,))
+        theme_name = result[0] if result else 'dark'
+        theme_cache.fill(user_id, theme_name, version)  # A theme set meanwhile wins
+        return theme_name
     except Exception as e:
         logger.error(f"Error getting user theme: {e}")
         return 'dark'
 
+async def prewarm_theme_cache(limit=THEME_CACHE_PREWARM):
+    """Load the themes of users with running timers, then the most recently changed ones"""
+    if limit <= 0:
+        return
+    try:
+        rows = await db.fetchall('''
+            SELECT user_id, theme_name, display_mode FROM user_themes
+            ORDER BY user_id IN (SELECT user_id FROM scheduled_timers) DESC, updated_at DESC
+            LIMIT ?
+        ''', (limit,))
+        # Users who set a preference since startup already have the newer value cached
+        for user_id, theme_name, display_mode in rows:
+            theme_cache.fill(user_id, theme_name, 0)
+            display_cache.fill(user_id, display_mode or 'live', 0)
+        logger.info(f"🎨 Prewarmed theme cache with {len(rows)} users")
+    except Exception as e:
+        logger.error(f"Error prewarming theme cache: {e}")
+
 def set_user_theme(user_id, theme_name):
-    """Save user theme to database"""
+    """Save a user theme to the cache and queue writing it to database"""
+    theme_cache.set(user_id, theme_name)
+    logger.info(f"Saving theme for user {user_id}: {theme_name}")
+    return db.execute('''
+        INSERT INTO user_themes (user_id, theme_name, updated_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(user_id) DO UPDATE SET 
+            theme_name = excluded.theme_name,
+            updated_at = CURRENT_TIMESTAMP
+    ''', (user_id, theme_name))
+
+async def get_user_display(user_id):
+    """Get user display mode ('live' or 'native') from the cache, falling back to the database"""
+    display_mode = display_cache.get(user_id)
+    if display_mode is not None:
+        return display_mode
+    
+    version = display_cache.version(user_id)
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO user_themes (user_id, theme_name, updated_at)
-            VALUES (?, ?, CURRENT_TIMESTAMP)
-            ON CONFLICT(user_id) DO UPDATE SET 
-                theme_name = excluded.theme_name,
-                updated_at = CURRENT_TIMESTAMP
-        ''', (user_id, theme_name))
-        conn.commit()
-        conn.close()
-        logger.info(f"Theme saved for user {user_id}: {theme_name}")
+        result = await db.fetchone('SELECT display_mode FROM user_themes WHERE user_id = ?', (user_id,))
+        display_mode = result[0] if result and result[0] else 'live'
+        display_cache.fill(user_id, display_mode, version)  # A mode set meanwhile wins
+        return display_mode
     except Exception as e:
-        logger.error(f"Error saving user theme: {e}")
+        logger.error(f"Error getting user display mode: {e}")
+        return 'live'
+
+def set_user_display(user_id, display_mode):
+    """Save a user display mode to the cache and queue writing it to database"""
+    display_cache.set(user_id, display_mode)
+    logger.info(f"Saving display mode for user {user_id}: {display_mode}")
+    return db.execute('''
+        INSERT INTO user_themes (user_id, display_mode, updated_at)
+        VALUES (?, ?, CURRENT_TIMESTAMP)
+        ON CONFLICT(user_id) DO UPDATE SET 
+            display_mode = excluded.display_mode,
+            updated_at = CURRENT_TIMESTAMP
+    ''', (user_id, display_mode))
+
+TIMER_COLUMNS = (
+    'id', 'user_id', 'guild_id', 'channel_id', 'message_id', 'end_time', 'total_seconds',
+    'message', 'theme_name', 'created_at', 'paused', 'pause_time', 'user_name', 'avatar_url', 'display_mode',
+    'cycle_work', 'cycle_rest', 'cycle_rounds', 'cycle_phase'
+)
+TIMER_COLUMNS_SQL = ', '.join(TIMER_COLUMNS)
+
+def save_timer(timer):
+    """Queue persisting a timer so it survives restarts"""
+    return db.execute(f'''
+        INSERT OR REPLACE INTO scheduled_timers ({TIMER_COLUMNS_SQL})
+        VALUES ({', '.join('?' * len(TIMER_COLUMNS))})
+    ''', timer.to_row())
 
-def save_timer_history(user_id, duration, message, completed):
-    """Save timer to history"""
+def update_timer_state(timer):
+    """Queue persisting pause state, deadline and phase changes of a timer"""
+    return db.execute('''
+        UPDATE scheduled_timers
+        SET end_time = ?, total_seconds = ?, paused = ?, pause_time = ?, cycle_phase = ?
+        WHERE id = ?
+    ''', (timer.end_time, timer.total_seconds, timer.paused, timer.pause_time,
+          timer.cycle.phase if timer.cycle else 0, timer.id))
+
+async def get_scheduled_timers(after=None, until=None, timer_id=None, user_id=None):
+    """Get stored timers due in (after, until], by ID or by owner"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO timer_history (user_id, duration, message, completed)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, duration, message, completed))
-        conn.commit()
-        conn.close()
+        if timer_id is not None:
+            return await db.fetchall(f'SELECT {TIMER_COLUMNS_SQL} FROM scheduled_timers WHERE id = ?', (timer_id,))
+        if user_id is not None:
+            return await db.fetchall(
+                f'SELECT {TIMER_COLUMNS_SQL} FROM scheduled_timers WHERE user_id = ? ORDER BY end_time', (user_id,)
+            )
+        return await db.fetchall(
+            f'SELECT {TIMER_COLUMNS_SQL} FROM scheduled_timers WHERE end_time > ? AND end_time <= ? ORDER BY end_time',
+            (after if after is not None else float('-inf'), until)
+        )
     except Exception as e:
-        logger.error(f"Error saving timer history: {e}")
+        logger.error(f"Error getting scheduled timers: {e}")
+        return []
 
-# --------- KEEP ALIVE ---------
-app = Flask(__name__)
-
-@app.route("/")
-def home():
-    return "✅ Bot is alive and running!"
-
-@app.route("/health")
-def health():
-    """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "bot_ready": bot.is_ready() if 'bot' in globals() else False,
-        "active_timers": len(bot.active_timers) if 'bot' in globals() else 0
-    }
+async def get_user_stats(user_id):
+    """Get (total, total_duration, completed) for a user, or None if they never used a timer"""
+    try:
+        return await db.fetchone(
+            'SELECT total, total_duration, completed FROM user_stats WHERE user_id = ?', (user_id,)
+        )
+    except Exception as e:
+        logger.error(f"Error getting user stats: {e}")
+        return None
+
+async def check_user_stats(repair=False):
+    """Compare user_stats against timer_history, optionally rebuilding the rows that drifted"""
+    mismatches = await db.read(find_user_stats_mismatches)
+    if not mismatches:
+        logger.info("✅ user_stats matches timer_history")
+        return mismatches
+    
+    logger.warning(f"⚠️ user_stats differs from timer_history for {len(mismatches)} users")
+    if repair:
+        await db.write(lambda conn: rebuild_user_stats(conn, mismatches))
+        logger.info(f"🔧 Rebuilt user_stats for {len(mismatches)} users")
+    return mismatches
+
+def touch_health_check(conn):
+    conn.execute('INSERT OR REPLACE INTO health_check (id, checked_at) VALUES (1, ?)', (time.time(),))
+    return True
+
+async def get_command_hash(scope):
+    """Hash of the command tree last synced for `scope`, or None"""
+    try:
+        result = await db.fetchone('SELECT tree_hash FROM command_sync WHERE scope = ?', (scope,))
+        return result[0] if result else None
+    except Exception as e:
+        logger.error(f"Error getting command hash: {e}")
+        return None
+
+def set_command_hash(scope, tree_hash):
+    """Queue recording the command tree hash synced for `scope`"""
+    return db.execute(
+        'INSERT OR REPLACE INTO command_sync (scope, tree_hash, synced_at) VALUES (?, ?, ?)',
+        (scope, tree_hash, time.time())
+    )
+
+def delete_timers(timer_ids):
+    """Queue removing finished timers from the durable store"""
+    return db.executemany('DELETE FROM scheduled_timers WHERE id = ?', [(timer_id,) for timer_id in timer_ids])
+
+def delete_timers_in(column, value):
+    """Queue removing every stored timer of a channel or guild; resolves to the deleted IDs"""
+    return db.write(lambda conn: [
+        timer_id for timer_id, in conn.execute(f'DELETE FROM scheduled_timers WHERE {column} = ? RETURNING id', (value,))
+    ])
 
-def run_web():
+async def get_parked_timers(after):
+    """(id, user_id, guild_id, message_id) of stored timers due after `after`"""
     try:
-        app.run(host="0.0.0.0", port=3000)
+        return await db.fetchall(
+            'SELECT id, user_id, guild_id, message_id FROM scheduled_timers WHERE end_time > ?', (after,)
+        )
     except Exception as e:
-        logger.error(f"Flask error: {e}")
+        logger.error(f"Error getting parked timers: {e}")
+        return []
+
+def insert_history(conn, history):
+    """Insert (user_id, duration, message, completed) rows, folding them into user_stats"""
+    # Aggregate the batch per user so user_stats gets one upsert per user
+    stats = {}
+    for user_id, duration, _, done in history:
+        total, done_count, total_duration = stats.get(user_id, (0, 0, 0))
+        stats[user_id] = (total + 1, done_count + bool(done), total_duration + (duration or 0))
+    
+    conn.executemany('''
+        INSERT INTO timer_history (user_id, duration, message, completed)
+        VALUES (?, ?, ?, ?)
+    ''', history)
+    conn.executemany('''
+        INSERT INTO user_stats (user_id, total, completed, total_duration)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT(user_id) DO UPDATE SET
+            total = total + excluded.total,
+            completed = completed + excluded.completed,
+            total_duration = total_duration + excluded.total_duration
+    ''', [(user_id,) + values for user_id, values in stats.items()])
+
+def finish_timers(timers, completed):
+    """Queue recording history and dropping a batch of finished timers in one transaction"""
+    history = [(timer.user_id, timer.total_seconds, timer.message, completed) for timer in timers]
+    timer_ids = [(timer.id,) for timer in timers]
+    
+    def write(conn):
+        insert_history(conn, history)
+        conn.executemany('DELETE FROM scheduled_timers WHERE id = ?', timer_ids)
+        return len(history)
+    
+    return db.write(write)
+
+def record_phases(history, timers):
+    """Queue recording finished phases of cycle timers and the phase each one is in now, in one transaction"""
+    states = [(timer.end_time, timer.total_seconds, timer.cycle.phase, timer.id) for timer in timers]
+    
+    def write(conn):
+        insert_history(conn, history)
+        conn.executemany(
+            'UPDATE scheduled_timers SET end_time = ?, total_seconds = ?, cycle_phase = ? WHERE id = ?', states
+        )
+        return len(history)
+    
+    return db.write(write)
+
+# --------- HISTORY MAINTENANCE ---------
+HISTORY_RETENTION_DAYS = int(os.environ.get("HISTORY_RETENTION_DAYS", 90))  # 0 keeps raw history forever
+HISTORY_ARCHIVE_DIR = os.environ.get("HISTORY_ARCHIVE_DIR", "archive")  # Empty deletes without archiving
+HISTORY_MAINTENANCE_INTERVAL = int(os.environ.get("HISTORY_MAINTENANCE_INTERVAL", 6 * 3600))
+HISTORY_BATCH_SIZE = 1000
+VACUUM_PAGES_PER_STEP = 256
+
+HISTORY_COLUMNS = ('id', 'user_id', 'duration', 'message', 'completed', 'created_at')
+
+def archive_history_rows(rows):
+    """Write a batch of history rows to gzip-compressed JSON-lines files, one per month.
+
+    Files are named after the month and the batch's first id and replaced
+    atomically, so archiving the same batch again rewrites its files rather
+    than duplicating lines.
+    """
+    archive_dir = Path(HISTORY_ARCHIVE_DIR)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(str(row[5])[:7], []).append(row)
+    
+    for month, month_rows in by_month.items():
+        path = archive_dir / f"timer_history-{month}-{rows[0][0]:010d}.jsonl.gz"
+        partial = path.with_name(path.name + '.tmp')
+        with gzip.open(partial, 'wt', encoding='utf-8') as f:
+            for row in month_rows:
+                f.write(json.dumps(dict(zip(HISTORY_COLUMNS, row)), ensure_ascii=False) + '\n')
+        os.replace(partial, path)
+
+def expired_history_batch(conn, limit):
+    """The oldest history rows past the retention window (ids follow creation order)"""
+    return conn.execute(f'''
+        SELECT {', '.join(HISTORY_COLUMNS)} FROM timer_history
+        WHERE created_at < datetime('now', ?)
+        ORDER BY id
+        LIMIT ?
+    ''', (f'-{HISTORY_RETENTION_DAYS} days', limit)).fetchall()
+
+def prune_history_rows(conn, rows):
+    """Roll up and delete history rows read by expired_history_batch; returns the count"""
+    daily = {}
+    for _, user_id, duration, _, completed, created_at in rows:
+        key = (user_id, str(created_at)[:10])
+        total, done, total_duration = daily.get(key, (0, 0, 0))
+        daily[key] = (total + 1, done + bool(completed), total_duration + (duration or 0))
+    
+    conn.executemany('''
+        INSERT INTO timer_history_daily (user_id, day, total, completed, total_duration)
+        VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT(user_id, day) DO UPDATE SET
+            total = total + excluded.total,
+            completed = completed + excluded.completed,
+            total_duration = total_duration + excluded.total_duration
+    ''', [key + values for key, values in daily.items()])
+    
+    conn.executemany('DELETE FROM timer_history WHERE id = ?', [(row[0],) for row in rows])
+    return len(rows)
+
+def vacuum_step(conn):
+    """Release a few free pages back to the filesystem; returns the pages still free"""
+    free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    # sqlite3 steps a PRAGMA without result rows only once, which frees a single page,
+    # so incremental_vacuum(N) would stop after one page: free them one call at a time
+    for _ in range(min(free, VACUUM_PAGES_PER_STEP)):
+        conn.execute('PRAGMA incremental_vacuum(1)')
+    return conn.execute('PRAGMA freelist_count').fetchone()[0]
+
+def analyze_step(conn):
+    conn.execute('PRAGMA analysis_limit=400')
+    conn.execute('PRAGMA optimize')
+
+async def run_history_maintenance():
+    """Prune old history in small transactions so live timer writes are never stalled for long"""
+    started = time.perf_counter()
+    pruned = 0
+    
+    if HISTORY_RETENTION_DAYS > 0:
+        while True:
+            rows = await db.read(lambda conn: expired_history_batch(conn, HISTORY_BATCH_SIZE))
+            if not rows:
+                break
+            # Archived before the delete: rows that could not be archived stay in the database,
+            # and a batch whose delete rolls back is archived again into the same files
+            if HISTORY_ARCHIVE_DIR:
+                try:
+                    await asyncio.to_thread(archive_history_rows, rows)
+                except Exception as e:
+                    logger.error(f"Could not archive history, keeping {len(rows)} rows: {e}")
+                    logger.error(traceback.format_exc())
+                    break
+            count = await db.write(lambda conn: prune_history_rows(conn, rows))
+            if not count:
+                break  # Rolled back; the next run retries this batch
+            pruned += count
+            await asyncio.sleep(0.05)  # Let queued live writes commit between batches
+    
+    # Incremental vacuum needs auto_vacuum=INCREMENTAL, which the startup conversion may have failed to set
+    released = 0
+    if (await db.fetchone('PRAGMA auto_vacuum'))[0] == 2:
+        while True:
+            before = (await db.fetchone('PRAGMA freelist_count'))[0]
+            remaining = await db.write(vacuum_step)
+            if remaining is None or remaining >= before:
+                break
+            released += before - remaining
+            await asyncio.sleep(0.05)
+    
+    await db.write(analyze_step)
+    logger.info(
+        f"🧹 History maintenance: pruned {pruned} rows, released {released} pages "
+        f"in {time.perf_counter() - started:.2f}s"
+    )
 
-threading.Thread(target=run_web, daemon=True).start()
+async def history_maintenance_loop():
+    await bot.wait_until_ready()
+    await asyncio.sleep(600)  # Stay out of the way of startup and restored timers
+    while True:
+        try:
+            await run_history_maintenance()
+        except Exception as e:
+            logger.error(f"Error in history maintenance: {e}")
+            logger.error(traceback.format_exc())
+        await asyncio.sleep(HISTORY_MAINTENANCE_INTERVAL)
+
+# --------- KEEP ALIVE ---------
+WEB_PORT = int(os.environ.get("PORT", 3000))
+HEALTH_MAX_LOOP_LAG = float(os.environ.get("HEALTH_MAX_LOOP_LAG", 1.0))  # Seconds before /health reports unhealthy
+
+def aiohttp_web():
+    """aiohttp.web, imported on first use: the bot logs in without it and the
+    server starts alongside the gateway connection"""
+    from aiohttp import web
+    return web
+
+async def home(request):
+    return aiohttp_web().Response(text="✅ Bot is alive and running!")
+
+async def database_writable():
+    try:
+        return bool(await asyncio.wait_for(db.write(touch_health_check), timeout=2))
+    except Exception:
+        return False
+
+async def health(request):
+    """Readiness: gateway connected, event loop responsive and database accepting writes"""
+    gateway = bot.is_ready() and not bot.is_closed()
+    loop_lag = bot.loop_lag.lag
+    writable = await database_writable()
+    healthy = gateway and writable and loop_lag < HEALTH_MAX_LOOP_LAG
+    return aiohttp_web().json_response({
+        "status": "healthy" if healthy else "unhealthy",
+        "bot_ready": gateway,
+        "gateway_latency_ms": round(bot.latency * 1000, 1) if gateway else None,
+        "loop_lag_ms": round(loop_lag * 1000, 1),
+        "database_writable": writable,
+        "active_timers": len(bot.active_timers),
+        "parked_timers": bot.active_timers.parked,
+        "theme_cache": theme_cache.stats(),
+        "refresh_policy": bot.refresh_policy.stats()
+    }, status=200 if healthy else 503)
+
+def _label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus_metric(lines, name, kind, help_text, samples):
+    """Append one metric in Prometheus text format; `samples` is a value or {labels: value}"""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    if not isinstance(samples, dict):
+        samples = {(): samples}
+    for labels, value in samples.items():
+        label_text = ','.join(f'{key}="{_label_value(val)}"' for key, val in labels)
+        lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+def render_metrics():
+    lines = []
+    prometheus_metric(lines, "timerbot_up", "gauge", "Whether the gateway connection is ready",
+                      int(bot.is_ready() and not bot.is_closed()))
+    prometheus_metric(lines, "timerbot_gateway_latency_seconds", "gauge", "Gateway heartbeat latency",
+                      bot.latency if bot.is_ready() else 0)
+    prometheus_metric(lines, "timerbot_loop_lag_seconds", "gauge", "Smoothed event-loop lag", bot.loop_lag.lag)
+    prometheus_metric(lines, "timerbot_active_timers", "gauge", "Timers held in memory", len(bot.active_timers))
+    prometheus_metric(lines, "timerbot_parked_timers", "gauge", "Timers stored only in SQLite", bot.active_timers.parked)
+    prometheus_metric(lines, "timerbot_completions_total", "counter", "Timers completed", bot.completions.completed)
+    prometheus_metric(lines, "timerbot_completion_batches_total", "counter", "Completion batches flushed",
+                      bot.completions.batches)
+    prometheus_metric(lines, "timerbot_edits_sent_total", "counter", "Message edits sent", bot.renderer.edits_sent)
+    prometheus_metric(lines, "timerbot_messages_sent_total", "counter", "Completion messages sent",
+                      bot.renderer.messages_sent)
+    prometheus_metric(lines, "timerbot_renders_skipped_total", "counter", "Renders with no visible change",
+                      bot.renderer.renders_skipped)
+    prometheus_metric(lines, "timerbot_rate_limited_total", "counter", "429 responses by route",
+                      {(('route', route),): count for route, count in bot.renderer.rate_limited.items()})
+    prometheus_metric(lines, "timerbot_refresh_decisions_total", "counter", "Refresh intervals chosen by reason",
+                      {(('policy', bot.refresh_policy.name), ('reason', reason)): count
+                       for reason, count in bot.refresh_policy.decisions.items()})
+    prometheus_metric(lines, "timerbot_db_commits_total", "counter", "Database group commits", db.commits)
+    prometheus_metric(lines, "timerbot_db_writes_total", "counter", "Database writes committed", db.writes)
+    for histogram in HISTOGRAMS:
+        histogram.expose(lines)
+    cache = theme_cache.stats()
+    prometheus_metric(lines, "timerbot_theme_cache_hits_total", "counter", "Theme cache hits", cache['hits'])
+    prometheus_metric(lines, "timerbot_theme_cache_misses_total", "counter", "Theme cache misses", cache['misses'])
+    return '\n'.join(lines) + '\n'
+
+async def metrics(request):
+    """Prometheus scrape endpoint"""
+    return aiohttp_web().Response(text=render_metrics(), content_type='text/plain', charset='utf-8')
+
+async def start_web_server():
+    """Serve / , /health and /metrics from the bot's own event loop"""
+    web = aiohttp_web()
+    app = web.Application()
+    app.router.add_get("/", home)
+    app.router.add_get("/health", health)
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        await web.TCPSite(runner, "0.0.0.0", WEB_PORT).start()
+        logger.info(f"🌐 Web server listening on port {WEB_PORT}")
+    except Exception as e:
+        logger.error(f"Web server error: {e}")
+    return runner
 
 # --------- ASCII NUMBERS ---------
 ASCII_NUMBERS = {
@@ -259,239 +1091,1548 @@ THEMES = {
     }
 }
 
+# --------- DISPLAY MODES ---------
+# 'native' shows the countdown as a Discord timestamp that clients tick themselves,
+# so the message is only edited when the timer changes state
+DISPLAY_MODES = {
+    'live': {
+        'emoji': '⏱️',
+        'name': 'الساعة الحية',
+        'description': 'ساعة كبيرة وشريط تقدم يتحدثان كل بضع ثوانٍ'
+    },
+    'native': {
+        'emoji': '🕒',
+        'name': 'العد التنازلي المدمج',
+        'description': 'عداد Discord المدمج، بدون تحديثات متكررة للرسالة'
+    }
+}
+
+# --------- TIMER RECORD ---------
+THEME_NAMES = tuple(THEMES)
+
+TIMER_IDS = itertools.count(time.time_ns() // 1000)  # Seeded past every ID issued by an earlier run
+
+def new_timer_id():
+    """Collision-free timer ID: a monotonic counter, short enough for a button custom_id"""
+    return f"{next(TIMER_IDS):x}"
+
+class Cycle:
+    """Phases of a recurring timer.
+
+    Work and rest phases alternate for `rounds` rounds, without a rest after
+    the last one; with no rest every phase is a repetition of the work length.
+    The timer keeps one scheduler entry and one message for the whole cycle,
+    and only `phase` moves.
+    """
+
+    __slots__ = ('work', 'rest', 'rounds', 'phase')
+
+    def __init__(self, work, rest, rounds, phase=0):
+        self.work = work
+        self.rest = rest or 0
+        self.rounds = rounds
+        self.phase = phase or 0
+
+    @property
+    def phases(self):
+        return self.rounds * 2 - 1 if self.rest else self.rounds
+
+    @property
+    def total_seconds(self):
+        return self.work * self.rounds + self.rest * (self.rounds - 1)
+
+    def is_work(self, phase):
+        return not self.rest or phase % 2 == 0
+
+    def seconds(self, phase):
+        return self.work if self.is_work(phase) else self.rest
+
+    def round(self, phase):
+        """1-based work round a phase belongs to (a rest belongs to the round before it)"""
+        return phase // 2 + 1 if self.rest else phase + 1
+
+class Timer:
+    """One active timer, stored as plain IDs and numbers.
+
+    No Discord objects are kept; the display message is rebuilt as a
+    PartialMessage when it is needed. `render_fields` holds the field values
+    of the last edit so unchanged displays are not sent again. `end_time` is
+    wall-clock (time.time()): it is stored in SQLite across restarts and shown
+    as a Discord <t:...> timestamp, neither of which a monotonic clock allows.
+    """
+
+    __slots__ = (
+        'id', 'user_id', 'guild_id', 'channel_id', 'message_id', 'end_time', 'total_seconds',
+        'message', 'theme', 'flags', 'pause_time', 'created_at', 'user_name', 'avatar_url',
+        'render_fields', 'touched_at', 'cycle'
+    )
+
+    PAUSED = 1
+    CANCELLED = 2
+    NATIVE = 4  # Countdown shown as a native timestamp, see DISPLAY_MODES
+
+    def __init__(self, timer_id, user_id, guild_id, channel_id, message_id, end_time, total_seconds,
+                 message=None, theme_name='dark', created_at=None, paused=False, pause_time=0,
+                 user_name=None, avatar_url=None, display_mode='live', cycle=None):
+        self.id = timer_id
+        self.user_id = user_id
+        self.guild_id = guild_id
+        self.channel_id = channel_id
+        self.message_id = message_id
+        self.end_time = end_time
+        self.total_seconds = total_seconds
+        self.message = message
+        self.theme = THEME_NAMES.index(theme_name if theme_name in THEMES else 'dark')
+        self.flags = (self.PAUSED if paused else 0) | (self.NATIVE if display_mode == 'native' else 0)
+        self.pause_time = pause_time or 0
+        self.created_at = created_at if created_at is not None else time.time()
+        self.user_name = user_name
+        self.avatar_url = avatar_url
+        self.render_fields = None
+        self.touched_at = 0  # Last button press, for refresh priority
+        self.cycle = cycle  # None for a one-off timer
+
+    @classmethod
+    def from_row(cls, row):
+        """Rebuild a timer from a scheduled_timers row"""
+        *fields, work, rest, rounds, phase = row
+        return cls(*fields, cycle=Cycle(work, rest, rounds, phase) if rounds else None)
+
+    def to_row(self):
+        """Flatten the timer into a scheduled_timers row (in TIMER_COLUMNS order)"""
+        cycle = self.cycle
+        return (
+            self.id, self.user_id, self.guild_id, self.channel_id, self.message_id, self.end_time,
+            self.total_seconds, self.message, self.theme_name, self.created_at, self.paused,
+            self.pause_time, self.user_name, self.avatar_url, self.display_mode
+        ) + ((cycle.work, cycle.rest, cycle.rounds, cycle.phase) if cycle else (0, 0, 0, 0))
+
+    @property
+    def theme_name(self):
+        return THEME_NAMES[self.theme]
+
+    @property
+    def native(self):
+        return bool(self.flags & self.NATIVE)
+
+    @property
+    def display_mode(self):
+        return 'native' if self.native else 'live'
+
+    @property
+    def paused(self):
+        return bool(self.flags & self.PAUSED)
+
+    @paused.setter
+    def paused(self, value):
+        self.flags = self.flags | self.PAUSED if value else self.flags & ~self.PAUSED
+
+    @property
+    def cancelled(self):
+        return bool(self.flags & self.CANCELLED)
+
+    @cancelled.setter
+    def cancelled(self, value):
+        self.flags = self.flags | self.CANCELLED if value else self.flags & ~self.CANCELLED
+
+    @property
+    def msg(self):
+        """The display message, as a PartialMessage"""
+        return timer_message(self.channel_id, self.guild_id, self.message_id)
+
+# --------- RENDER KERNEL ---------
+# Every tick renders the same few thousand strings, so they are built once and looked up
+RENDER_CACHE_SIZE = 8192  # Covers every MM:SS up to 99:59 plus headroom
+
+PROGRESS_FILLS = ('🟥', '🟧', '🟨', '🟩')  # By quarter, lowest first
+PROGRESS_EMPTY = '⬜'
+PROGRESS_LENGTH = 20
+
+# All 21 bar states per colour band for the default bar length
+PROGRESS_BARS = tuple(
+    tuple(fill * filled + PROGRESS_EMPTY * (PROGRESS_LENGTH - filled) for filled in range(PROGRESS_LENGTH + 1))
+    for fill in PROGRESS_FILLS
+)
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _ascii_time(minutes, seconds):
+    time_str = f"{minutes:02d}:{seconds:02d}"
+    glyphs = [ASCII_NUMBERS[char] for char in time_str if char in ASCII_NUMBERS]
+    return '\n'.join(''.join(glyph[row] + ' ' for glyph in glyphs) for row in range(6))
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _clock_block(minutes, seconds):
+    return f"```\n{create_ascii_time(minutes, seconds)}\n```"
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def _progress_bar(band, filled, percentage, length):
+    if length == PROGRESS_LENGTH:
+        bar = PROGRESS_BARS[band][filled]
+    else:
+        bar = PROGRESS_FILLS[band] * filled + PROGRESS_EMPTY * (length - filled)
+    return f"{bar} {percentage}%"
+
+# --------- DURATION PARSER ---------
+# Durations are read left to right in one pass: each token is a number and a unit, units
+# must go from largest to smallest without repeats, and a bare number means minutes
+DURATION_CACHE_SIZE = 256  # Users type the same few durations ('25m', '5m', '1h') over and over
+
+DURATION_UNITS = {
+    word: seconds
+    for seconds, words in (
+        (86400, 'd day days يوم يوما أيام ايام ي'),
+        (3600, 'h hr hrs hour hours ساعة ساعه ساعات س'),
+        (60, 'm min mins minute minutes دقيقة دقيقه دقائق دقايق د'),
+        (1, 's sec secs second seconds ثانية ثانيه ثواني ثوان ث'),
+    )
+    for word in words.split()
+}
+
+# Arabic-Indic and Persian digits, and the Arabic decimal separator
+DURATION_DIGITS = str.maketrans('٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹٫', '0123456789' * 2 + '.')
+
+# Optional joiner ('و', 'and' or a comma), a number of at most 9 digits and 6 decimals, then a unit word
+DURATION_TOKEN = re.compile(
+    r'\s*(?:(و|and|,)\s*)?([0-9]{1,9}(?:\.[0-9]{1,6})?|\.[0-9]{1,6})(?![0-9.])\s*([^\W\d_]*)'
+)
+
+@functools.lru_cache(maxsize=DURATION_CACHE_SIZE)
+def _parse_duration(text):
+    """Seconds in a duration string; raises ValueError with the reason"""
+    text = text.lower().strip().translate(DURATION_DIGITS)
+    if not text:
+        raise ValueError("empty duration")
+
+    total = 0  # In millionths of a second, so decimals add up exactly
+    previous_unit = None
+    pos = 0
+    while pos < len(text):
+        match = DURATION_TOKEN.match(text, pos)
+        if match is None:
+            raise ValueError(f"unexpected {text[pos:]!r}")
+        joiner, number, unit = match.groups()
+        if joiner and pos == 0:
+            raise ValueError(f"leading {joiner!r}")
+        if not unit:
+            if pos or match.end() < len(text):
+                raise ValueError("a number without a unit must be the whole duration")
+            unit = 'm'
+        seconds = DURATION_UNITS.get(unit)
+        if seconds is None:
+            raise ValueError(f"unknown unit {unit!r}")
+        if previous_unit is not None and seconds >= previous_unit:
+            raise ValueError(f"unit {unit!r} repeated or out of order")
+        previous_unit = seconds
+        whole, _, fraction = number.partition('.')
+        total += (int(whole or 0) * 1000000 + int(fraction.ljust(6, '0'))) * seconds
+        pos = match.end()
+
+    total = (total + 500000) // 1000000  # Half a second rounds up
+    if total <= 0:
+        raise ValueError("Duration must be greater than 0")
+    return total
+
 # --------- HELPER FUNCTIONS ---------
 def create_ascii_time(minutes, seconds):
     """Create ASCII art for time display"""
     try:
-        time_str = f"{minutes:02d}:{seconds:02d}"
-        lines = ['', '', '', '', '', '']
-        
-        for char in time_str:
-            if char in ASCII_NUMBERS:
-                for i, line in enumerate(ASCII_NUMBERS[char]):
-                    lines[i] += line + ' '
-        
-        return '\n'.join(lines)
+        return _ascii_time(minutes, seconds)
     except Exception as e:
         logger.error(f"Error creating ASCII time: {e}")
         return f"{minutes:02d}:{seconds:02d}"
 
+def create_clock_block(remaining):
+    """ASCII clock for `remaining` seconds wrapped in a code block, ready for an embed field"""
+    return _clock_block(remaining // 60, remaining % 60)
+
 def create_progress_bar(current, total, length=20):
     """Create a progress bar with emoji"""
     try:
         if total <= 0:
             return "▒" * length + " 0%"
         
-        filled = int((current / total) * length)
-        filled = max(0, min(filled, length))
+        ratio = current / total
+        filled = max(0, min(int(ratio * length), length))
         
         # Use different emoji based on progress
-        if current / total > 0.75:
-            fill_char = '🟩'
-        elif current / total > 0.50:
-            fill_char = '🟨'
-        elif current / total > 0.25:
-            fill_char = '🟧'
+        if ratio > 0.75:
+            band = 3
+        elif ratio > 0.50:
+            band = 2
+        elif ratio > 0.25:
+            band = 1
         else:
-            fill_char = '🟥'
-        
-        empty_char = '⬜'
+            band = 0
         
-        bar = fill_char * filled + empty_char * (length - filled)
-        percentage = int((current / total) * 100)
-        return f"{bar} {percentage}%"
+        return _progress_bar(band, filled, int(ratio * 100), length)
     except Exception as e:
         logger.error(f"Error creating progress bar: {e}")
         return "Error"
 
 def parse_time(time_str):
-    """Parse time string like '5m', '2h', '30s', '1h30m'"""
+    """Parse time string like '5m', '2h', '30s', '1h30m', '1.5h', '2d' or '٢٥ دقيقة'"""
     try:
-        time_str = str(time_str).lower().strip()
-        total_seconds = 0
-        
-        # Handle combined format like "1h30m"
-        import re
-        
-        # Extract hours
-        hours_match = re.search(r'(\d+)h', time_str)
-        if hours_match:
-            total_seconds += int(hours_match.group(1)) * 3600
-        
-        # Extract minutes
-        minutes_match = re.search(r'(\d+)m', time_str)
-        if minutes_match:
-            total_seconds += int(minutes_match.group(1)) * 60
-        
-        # Extract seconds
-        seconds_match = re.search(r'(\d+)s', time_str)
-        if seconds_match:
-            total_seconds += int(seconds_match.group(1))
-        
-        # If no unit found, default to minutes
-        if total_seconds == 0 and time_str.isdigit():
-            total_seconds = int(time_str) * 60
+        return _parse_duration(str(time_str))
+    except ValueError as e:
+        logger.error(f"Error parsing time '{time_str}': {e}")
+        raise ValueError(f"صيغة الوقت غير صحيحة: {time_str}\nاستخدم: 5m, 2h, 30s, 1h30m, 1.5h, 2d أو 25 دقيقة")
+
+@functools.lru_cache(maxsize=RENDER_CACHE_SIZE)
+def format_time(seconds):
+    """Format seconds to readable Arabic time"""
+    try:
+        seconds = int(seconds)
+        days = seconds // 86400
+        hours = (seconds % 86400) // 3600
+        minutes = (seconds % 3600) // 60
+        secs = seconds % 60
         
-        if total_seconds <= 0:
-            raise ValueError("Duration must be greater than 0")
+        parts = []
+        if days > 0:
+            parts.append(f"{days}ي")
+        if hours > 0:
+            parts.append(f"{hours}س")
+        if minutes > 0:
+            parts.append(f"{minutes}د")
+        if secs > 0 or len(parts) == 0:
+            parts.append(f"{secs}ث")
         
-        return total_seconds
+        return " ".join(parts)
+    except Exception as e:
+        logger.error(f"Error formatting time: {e}")
+        return "Unknown"
+
+def validate_duration(seconds):
+    """Validate timer duration"""
+    if seconds <= 0:
+        raise ValueError("المدة يجب أن تكون أكبر من 0")
+    if seconds > MAX_TIMER_SECONDS:
+        raise ValueError(f"الحد الأقصى {format_time(MAX_TIMER_SECONDS)}")
+    if seconds < 10:  # Min 10 seconds
+        raise ValueError("الحد الأدنى 10 ثواني")
+    return True
+
+def validate_cycle(cycle):
+    """Validate the span of a whole recurring timer"""
+    if cycle.total_seconds > MAX_TIMER_SECONDS:
+        raise ValueError(f"مدة الدورة كاملة ({format_time(cycle.total_seconds)}) تتجاوز الحد الأقصى {format_time(MAX_TIMER_SECONDS)}")
+    return True
+
+# --------- TIMING WHEEL ---------
+class TimingWheel:
+    """Hierarchical timing wheel for far-future events.
+
+    Levels hold one-second, one-minute, one-hour and one-day slots. Insert and
+    cancel are O(1); an entry sits in a coarse slot until that slot cascades
+    down into the finer levels as its due time approaches.
+    """
+
+    LEVELS = ((1, 60), (60, 60), (3600, 24), (86400, 64))  # (slot size, slot count)
+
+    def __init__(self, now):
+        self._current = int(now)  # Last second that has been processed
+        self._slots = [[set() for _ in range(count)] for _, count in self.LEVELS]
+        self._counts = [0] * len(self.LEVELS)
+        self._where = {}  # key -> (level, slot, due)
+
+    def __len__(self):
+        return len(self._where)
+
+    def __contains__(self, key):
+        return key in self._where
+
+    def insert(self, key, due):
+        self.cancel(key)
+        # Expire on the whole second before `due`; callers hand the remainder to a finer timer
+        self._place(key, max(int(due), self._current + 1))
+
+    def cancel(self, key):
+        where = self._where.pop(key, None)
+        if where is not None:
+            level, slot, _ = where
+            self._slots[level][slot].discard(key)
+            self._counts[level] -= 1
+
+    def _place(self, key, due):
+        delta = due - self._current
+        for level, (size, count) in enumerate(self.LEVELS):
+            if delta < size * count or level == len(self.LEVELS) - 1:
+                # Clamp to the wheel span; the entry is re-placed when its slot cascades
+                slot_due = min(due, self._current + size * count - 1)
+                slot = (slot_due // size) % count
+                self._slots[level][slot].add(key)
+                self._counts[level] += 1
+                self._where[key] = (level, slot, due)
+                return
+
+    def next_deadline(self):
+        """Earliest second at which an entry expires or a slot cascades"""
+        best = None
+        for level, (size, count) in enumerate(self.LEVELS):
+            if not self._counts[level]:
+                continue
+            base = self._current // size
+            for step in range(1, count + 1):
+                if self._slots[level][(base + step) % count]:
+                    at = (base + step) * size
+                    if best is None or at < best:
+                        best = at
+                    break
+        return best
+
+    def advance(self, now):
+        """Move the wheel to `now` and return [(key, due)] for expired entries"""
+        expired = []
+        while True:
+            at = self.next_deadline()
+            if at is None or at > now:
+                break
+            self._current = at
+
+            # Cascade coarse slots from the top down, then expire the second slot
+            for level in range(len(self.LEVELS) - 1, -1, -1):
+                size, count = self.LEVELS[level]
+                if at % size:
+                    continue
+                bucket = self._slots[level][(at // size) % count]
+                if not bucket:
+                    continue
+                keys = list(bucket)
+                bucket.clear()
+                self._counts[level] -= len(keys)
+                for key in keys:
+                    _, _, due = self._where.pop(key)
+                    if due <= at:
+                        expired.append((key, due))
+                    else:
+                        self._place(key, due)
+
+        self._current = max(self._current, int(now))
+        return expired
+
+# --------- TIMER SCHEDULER ---------
+class TimerScheduler:
+    """Drive every active timer from one heap keyed by its next due event.
+
+    The loop sleeps exactly until the earliest entry is due, so wakeups scale
+    with the work that is actually due rather than with the number of timers.
+    Events further out than WHEEL_THRESHOLD wait in a timing wheel instead of
+    the heap, and timers beyond MEMORY_HORIZON are only kept in SQLite.
+    """
+
+    WHEEL_THRESHOLD = 60
+
+    def __init__(self, bot_instance):
+        self.bot = bot_instance
+        self._heap = []
+        self._wheel = TimingWheel(time.time())
+        self._seq = itertools.count()
+        self._entries = {}  # timer_id -> (seq, when) of its live entry
+        self._running = set()
+        self._refire = set()
+        self._wakeup = asyncio.Event()
+        self._sleep_until = float('inf')
+        self._task = None
+        self._loader_task = None
+        self._loaded_until = float('-inf')
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            self._loader_task = asyncio.create_task(self._load_horizon())
+            logger.info("⏱️ Timer scheduler started")
+
+    def schedule(self, timer_id, when):
+        """Schedule the next event of a timer, keeping the earlier one if both exist"""
+        current = self._entries.get(timer_id)
+        if current is not None and current[1] <= when:
+            return
+
+        self._wheel.cancel(timer_id)
+        seq = next(self._seq)
+        self._entries[timer_id] = (seq, when)
+
+        if when - time.time() >= self.WHEEL_THRESHOLD:
+            # Cascades may run late; the loop only has to wake up by the due time itself
+            self._wheel.insert(timer_id, when)
+            if when < self._sleep_until:
+                self._wakeup.set()
+            return
+
+        self._push(timer_id, seq, when)
+
+    def _push(self, timer_id, seq, when):
+        heapq.heappush(self._heap, (when, seq, timer_id))
+
+        # Stale entries are skipped lazily; rebuild if they start to dominate
+        if len(self._heap) > 2 * len(self._entries) + 64:
+            self._heap = [(w, s, t) for t, (s, w) in self._entries.items() if t not in self._wheel]
+            heapq.heapify(self._heap)
+
+        if when < self._sleep_until:
+            self._wakeup.set()
+
+    def wake(self, timer_id):
+        """Run a timer's next event right away, e.g. after its state changed"""
+        self.schedule(timer_id, time.time())
+
+    def unschedule(self, timer_id):
+        self._entries.pop(timer_id, None)
+        self._wheel.cancel(timer_id)
+        self._refire.discard(timer_id)
+
+    async def _run(self):
+        while True:
+            try:
+                now = time.time()
+
+                # Events coming out of the wheel join the heap with their exact time
+                for timer_id, _ in self._wheel.advance(now):
+                    entry = self._entries.get(timer_id)
+                    if entry is not None:
+                        self._push(timer_id, *entry)
+
+                while self._heap and self._heap[0][0] <= now:
+                    when, seq, timer_id = heapq.heappop(self._heap)
+                    entry = self._entries.get(timer_id)
+                    if entry is None or entry[0] != seq:
+                        continue  # Stale entry
+                    del self._entries[timer_id]
+                    scheduler_lateness_seconds.observe(now - when)
+
+                    if timer_id in self._running:
+                        self._refire.add(timer_id)
+                    else:
+                        self._running.add(timer_id)
+                        asyncio.create_task(self._fire(timer_id))
+
+                deadlines = [self._heap[0][0]] if self._heap else []
+                wheel_deadline = self._wheel.next_deadline()
+                if wheel_deadline is not None:
+                    deadlines.append(wheel_deadline)
+                delay = max(0, min(deadlines) - now) if deadlines else None
+                self._sleep_until = now + delay if delay is not None else float('inf')
+
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in timer scheduler: {e}")
+                logger.error(traceback.format_exc())
+                await asyncio.sleep(1)
+
+    async def _fire(self, timer_id):
+        next_due = None
+        try:
+            next_due = await process_timer(timer_id)
+        except Exception as e:
+            logger.error(f"Error processing timer {timer_id}: {e}")
+            logger.error(traceback.format_exc())
+            next_due = time.time() + 5
+        finally:
+            self._running.discard(timer_id)
+
+        if timer_id not in self.bot.active_timers:
+            self.unschedule(timer_id)
+            return
+
+        if timer_id in self._refire:
+            self._refire.discard(timer_id)
+            self.schedule(timer_id, time.time())
+        elif next_due is not None:
+            self.schedule(timer_id, next_due)
+
+    async def _load_horizon(self):
+        """Restore stored timers, then keep pulling in those that come within MEMORY_HORIZON"""
+        interval = max(60, (MEMORY_HORIZON - LIVE_WINDOW) // 2)
+        await self.restore()
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                until = time.time() + MEMORY_HORIZON
+                rows = await get_scheduled_timers(after=self._loaded_until, until=until)
+                self._loaded_until = until
+                for row in rows:
+                    self._load_row(row)
+                if rows:
+                    logger.info(f"Loaded {len(rows)} scheduled timers into memory")
+            except Exception as e:
+                logger.error(f"Error loading scheduled timers: {e}")
+                logger.error(traceback.format_exc())
+
+    async def restore(self):
+        """Bulk-load stored timers after a restart and finish the ones that expired meanwhile"""
+        try:
+            started = time.perf_counter()
+            now = time.time()
+            self._loaded_until = now + MEMORY_HORIZON
+            rows = await get_scheduled_timers(until=self._loaded_until)
+
+            expired = []
+            for row in rows:
+                timer = Timer.from_row(row)
+                if timer.end_time <= now and not timer.paused:
+                    # Cycle timers skip the phases that ended while the bot was down
+                    if timer.cycle is None or not next_phase(timer, late=True):
+                        expired.append(timer)
+                        continue
+                if timer.id not in self.bot.active_timers:
+                    self.bot.active_timers.add(timer)
+                    if not timer.paused:
+                        self.schedule(timer.id, next_timer_event(timer))
+
+            for row in await get_parked_timers(self._loaded_until):
+                self.bot.active_timers.park(*row)
+
+            for timer in expired:
+                self.bot.completions.complete(timer, late=True)
+
+            logger.info(
+                f"♻️ Restored {len(rows) - len(expired)} timers ({self.bot.active_timers.parked} parked) "
+                f"and completed {len(expired)} expired ones "
+                f"in {time.perf_counter() - started:.2f}s"
+            )
+        except Exception as e:
+            logger.error(f"Error restoring timers: {e}")
+            logger.error(traceback.format_exc())
+
+    async def ensure_loaded(self, timer_id, user_id):
+        """Bring a timer into memory for its owner, loading it from SQLite if it is parked there.
+
+        Returns the owner's user ID (None if the timer does not exist); a parked
+        timer is only loaded when that is `user_id`.
+        """
+        timer = self.bot.active_timers.get(timer_id)
+        if timer is not None:
+            return timer.user_id
+        if timer_id in self.bot.completions:
+            return None  # Finished, its row is about to be deleted
+
+        rows = await get_scheduled_timers(timer_id=timer_id)
+        if not rows:
+            return None
+        owner = rows[0][TIMER_COLUMNS.index('user_id')]
+        if owner == user_id:
+            self._load_row(rows[0])
+        return owner
+
+    def _load_row(self, row):
+        timer = Timer.from_row(row)
+        if timer.id not in self.bot.active_timers:
+            self.bot.active_timers.add(timer)
+            if not timer.paused:
+                self.schedule(timer.id, next_timer_event(timer))
+
+# --------- RENDER SCHEDULER ---------
+class TokenBucket:
+    """Token bucket with a rate that can be lowered after a 429"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.max_rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now, reserve=0):
+        """Seconds until a token is available with `reserve` tokens left over"""
+        self._refill(now)
+        needed = 1 + reserve
+        return 0 if self.tokens >= needed else (needed - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def penalize(self, retry_after):
+        """Halve the rate and block the bucket for `retry_after` seconds"""
+        self._refill(time.monotonic())
+        self.rate = max(self.max_rate / 8, self.rate / 2)
+        self.tokens = min(self.tokens, 0) - retry_after * self.rate
+
+    def reward(self):
+        self.rate = min(self.max_rate, self.rate + self.max_rate * 0.05)
+
+
+class RateLimitWatcher(logging.Handler):
+    """Feed the 429s that discord.py retries internally into the render scheduler"""
+
+    def __init__(self, renderer):
+        super().__init__(level=logging.WARNING)
+        self.renderer = renderer
+        self._pending = None  # Per-route 429 held until it is known whether it was global
+
+    def emit(self, record):
+        try:
+            if record.msg.startswith('We are being rate limited.') and len(record.args) >= 3:
+                method, url, retry_after = record.args[:3]
+                # For a global 429 discord.py logs "Global rate limit has been hit" right after
+                # this record, before it awaits, so hold it until the current callback is done
+                self._flush()
+                self._pending = (method, str(url), float(retry_after))
+                asyncio.get_running_loop().call_soon(self._flush)
+            elif record.msg.startswith('Global rate limit has been hit.') and record.args:
+                self._pending = None  # The same 429, counted once and only against the global bucket
+                self.renderer.note_rate_limit(None, None, float(record.args[0]), is_global=True)
+        except Exception:
+            self._flush()
+
+    def _flush(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            self.renderer.note_rate_limit(*pending)
+
+
+class RenderScheduler:
+    """Coalesce embed edits and spread them over Discord's edit budgets.
+
+    Only the latest render per message is kept, each channel and the bot as a
+    whole get a token bucket, and edits are spaced out with jitter. Renders are
+    built when the edit is actually sent, so a queued edit is never stale.
+    New messages (completion pings) queue per channel under their own send
+    bucket and share the global bucket with edits, which leave part of it to
+    queued messages.
+    """
+
+    GLOBAL_RATE = 40.0  # Discord allows 50 requests/s globally
+    CHANNEL_RATE = 1.0  # Message edits are limited to about 5 per 5s per channel
+    CHANNEL_BURST = 1
+    SEND_RATE = 1.0  # Sends have their own 5 per 5s bucket per channel
+    SEND_BURST = 5
+    SEND_ATTEMPTS = 3  # Tries for a message that keeps getting 429s
+    JITTER = 0.2
+
+    _CHANNEL_URL = re.compile(r'/channels/(\d+)/')
+    _ROUTE_IDS = re.compile(r'/webhooks/\d+/[^/]+|/\d+')
+    _API_PREFIX = re.compile(r'^.*?/api/v\d+')
+
+    def __init__(self):
+        self._queues = {}  # channel_id -> OrderedDict(message_id -> entry)
+        self._members = {}  # channel_id -> message ids with live timers
+        self._member_count = 0
+        self._rate_limit_times = deque()  # Monotonic times of recent 429s
+        self._buckets = {}
+        self._send_buckets = {}
+        self._global = TokenBucket(self.GLOBAL_RATE, self.GLOBAL_RATE)
+        self._ready = []  # heap of (ready_at, seq, channel_id)
+        self._scheduled = {}  # channel_id -> earliest ready_at in the heap
+        self._inflight = set()
+        self._sends = {}  # channel_id -> deque of (send, future, attempts left)
+        self._queued_sends = 0
+        self._sending = set()  # Channels with a message send in flight
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self.rate_limited = Counter()  # route -> 429 count
+        self.edits_sent = 0
+        self.messages_sent = 0
+        self.renders_skipped = 0  # Renders that produced no visible change
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logging.getLogger('discord.http').addHandler(RateLimitWatcher(self))
+            logger.info("🖌️ Render scheduler started")
+
+    def _bucket(self, channel_id):
+        bucket = self._buckets.get(channel_id)
+        if bucket is None:
+            bucket = self._buckets[channel_id] = TokenBucket(self.CHANNEL_RATE, self.CHANNEL_BURST)
+        return bucket
+
+    def _send_bucket(self, channel_id):
+        bucket = self._send_buckets.get(channel_id)
+        if bucket is None:
+            bucket = self._send_buckets[channel_id] = TokenBucket(self.SEND_RATE, self.SEND_BURST)
+        return bucket
+
+    def send_message(self, channel_id, send):
+        """Queue `send()`, a coroutine function posting one message in the channel.
+
+        Messages of a channel go out one at a time, in order. Returns a future
+        that resolves once the message is sent or raises the final error.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._sends.setdefault(channel_id, deque()).append((send, future, self.SEND_ATTEMPTS))
+        self._queued_sends += 1
+        self._wake_channel(channel_id, time.monotonic())
+        return future
+
+    def submit(self, message, render, on_missing=None, final=False, track=True, on_failed=None):
+        """Queue an edit of `message`; `render()` returns the edit kwargs (or None to skip).
+
+        `on_failed(error)` runs when the edit does not go through. Untracked messages
+        (one-off edits) do not count towards the refresh load of their channel.
+        """
+        channel_id = message.channel.id
+        queue = self._queues.setdefault(channel_id, OrderedDict())
+        queue[message.id] = (message, render, on_missing, final, on_failed)
+
+        if final:
+            queue.move_to_end(message.id, last=False)  # Final states jump the queue
+        elif track:
+            members = self._members.setdefault(channel_id, set())
+            if message.id not in members:
+                members.add(message.id)
+                self._member_count += 1
+
+        self._wake_channel(channel_id, time.monotonic())
+
+    def forget(self, message):
+        """Stop counting a message towards its channel's refresh load"""
+        members = self._members.get(message.channel.id)
+        if members is not None and message.id in members:
+            members.discard(message.id)
+            self._member_count -= 1
+            if not members:
+                del self._members[message.channel.id]
+
+    def refresh_interval(self, channel_id, base):
+        """Refresh interval for a timer so its channel and the bot stay within budget"""
+        bucket = self._bucket(channel_id)
+        channel_share = len(self._members.get(channel_id, ())) / bucket.rate
+        global_share = self._member_count / self._global.rate
+        return max(base, channel_share, global_share) * random.uniform(1.0, 1.0 + self.JITTER)
+
+    def load(self, base):
+        """Share of the global edit budget used if every live message refreshed every `base` seconds"""
+        return self._member_count / (base * self._global.rate)
+
+    def recent_rate_limits(self, window):
+        """Number of 429s seen in the last `window` seconds"""
+        cutoff = time.monotonic() - window
+        while self._rate_limit_times and self._rate_limit_times[0] < cutoff:
+            self._rate_limit_times.popleft()
+        return len(self._rate_limit_times)
+
+    def note_rate_limit(self, method, url, retry_after, is_global=False):
+        self._rate_limit_times.append(time.monotonic())
+        if is_global:
+            self.rate_limited['global'] += 1
+            self._global.penalize(retry_after)
+            return
+
+        self.rate_limited[f"{method} {self._ROUTE_IDS.sub('/{id}', self._API_PREFIX.sub('', url))}"] += 1
+        match = self._CHANNEL_URL.search(url)
+        if match:
+            channel_id = int(match.group(1))
+            # Sends and edits have separate per-channel limits
+            bucket = self._send_bucket(channel_id) if method == 'POST' else self._bucket(channel_id)
+            bucket.penalize(retry_after)
+
+    def _wake_channel(self, channel_id, ready_at):
+        scheduled = self._scheduled.get(channel_id)
+        if scheduled is not None and scheduled <= ready_at:
+            return
+        # An earlier wake-up supersedes the one already in the heap
+        self._scheduled[channel_id] = ready_at
+        heapq.heappush(self._ready, (ready_at, next(self._seq), channel_id))
+        self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                now = time.monotonic()
+
+                while self._ready and self._ready[0][0] <= now:
+                    ready_at, _, channel_id = heapq.heappop(self._ready)
+                    if self._scheduled.get(channel_id) != ready_at:
+                        continue  # Superseded by an earlier wake-up
+                    del self._scheduled[channel_id]
+                    sends = self._sends.get(channel_id)
+                    if sends:
+                        self._dispatch_send(channel_id, sends, now)
+                    self._dispatch(channel_id, now)
+
+                delay = self._ready[0][0] - now if self._ready else None
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Error in render scheduler: {e}")
+                logger.error(traceback.format_exc())
+                await asyncio.sleep(1)
+
+    def _dispatch_send(self, channel_id, sends, now):
+        if channel_id in self._sending:
+            return  # _post wakes the channel when it is done
+
+        bucket = self._send_bucket(channel_id)
+        wait = max(bucket.delay(now), self._global.delay(now))
+        if wait > 0:
+            self._wake_channel(channel_id, now + wait * random.uniform(1.0, 1.0 + self.JITTER))
+            return
+
+        send, future, attempts = sends.popleft()
+        self._queued_sends -= 1
+        if not sends:
+            del self._sends[channel_id]
+        bucket.take()
+        self._global.take()
+        self._sending.add(channel_id)
+        asyncio.create_task(self._post(channel_id, send, future, attempts))
+
+    async def _post(self, channel_id, send, future, attempts):
+        try:
+            await send()
+            self.messages_sent += 1
+            self._send_bucket(channel_id).reward()
+            self._global.reward()
+            if not future.done():
+                future.set_result(True)
+        except discord.HTTPException as e:
+            if e.status == 429:
+                self._send_bucket(channel_id).penalize(getattr(e, 'retry_after', None) or 5)
+            if e.status == 429 and attempts > 1:
+                # Back to the front of the queue so the channel's messages stay in order
+                self._sends.setdefault(channel_id, deque()).appendleft((send, future, attempts - 1))
+                self._queued_sends += 1
+            elif not future.done():
+                future.set_exception(e)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        finally:
+            self._sending.discard(channel_id)
+            if self._sends.get(channel_id):
+                self._wake_channel(channel_id, time.monotonic())
+
+    def _dispatch(self, channel_id, now):
+        queue = self._queues.get(channel_id)
+        if not queue:
+            self._queues.pop(channel_id, None)
+            return
+
+        bucket = self._bucket(channel_id)
+        # Queued messages (pings) go first: edits leave up to half the global budget to them
+        reserve = min(self._queued_sends, self._global.capacity / 2)
+        wait = max(bucket.delay(now), self._global.delay(now, reserve))
+        if wait > 0:
+            self._wake_channel(channel_id, now + wait * random.uniform(1.0, 1.0 + self.JITTER))
+            return
+
+        # Messages with an edit in flight wait for it, so edits never land out of order
+        for message_id in [m for m in queue if m not in self._inflight]:
+            message, render, on_missing, final, on_failed = queue.pop(message_id)
+            try:
+                kwargs = render()
+            except Exception as e:
+                logger.error(f"Error rendering message {message_id}: {e}")
+                kwargs = None
+            if kwargs is None:
+                self.renders_skipped += 1
+                if final:
+                    self.forget(message)
+                continue
+
+            bucket.take()
+            self._global.take()
+            self._inflight.add(message_id)
+            asyncio.create_task(self._send(channel_id, message, kwargs, on_missing, final, on_failed))
+            break
+
+        if queue:
+            spacing = random.uniform(0, self.JITTER) / bucket.rate
+            self._wake_channel(channel_id, now + spacing)
+
+    async def _send(self, channel_id, message, kwargs, on_missing, final, on_failed):
+        message_id = message.id
+        started = time.perf_counter()
+        try:
+            await message.edit(**kwargs)
+            edit_seconds.observe(time.perf_counter() - started)
+            self.edits_sent += 1
+            self._bucket(channel_id).reward()
+            self._global.reward()
+        except discord.NotFound:
+            logger.warning(f"Message {message_id} no longer exists")
+            self.forget(message)
+            if on_missing:
+                on_missing()
+        except discord.HTTPException as e:
+            logger.error(f"HTTP error editing message {message_id}: {e}")
+            if e.status == 429:
+                self._bucket(channel_id).penalize(getattr(e, 'retry_after', None) or 5)
+            if on_failed:
+                on_failed(e)
+        except Exception as e:
+            logger.error(f"Error editing message {message_id}: {e}")
+            if on_failed:
+                on_failed(e)
+        finally:
+            self._inflight.discard(message_id)
+            if final:
+                self.forget(message)
+            if self._queues.get(channel_id):
+                self._wake_channel(channel_id, time.monotonic())
+
+# --------- REFRESH POLICY ---------
+REFRESH_POLICY = os.environ.get("REFRESH_POLICY", "adaptive")  # 'adaptive' or 'fixed'
+
+class LoopLagMonitor:
+    """Smoothed event-loop lag: how late a short sleep wakes up"""
+
+    SAMPLE = 0.5  # Seconds between probes
+
+    def __init__(self):
+        self.lag = 0.0  # Seconds
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.SAMPLE)
+            lag = max(0.0, loop.time() - started - self.SAMPLE)
+            self.lag = 0.8 * self.lag + 0.2 * lag
+
+class RefreshPolicy:
+    """Decides how long a live timer waits before its next re-render.
+
+    Subclasses implement interval(); every decision is counted by reason so
+    the policy's behaviour shows up in /health.
+    """
+
+    name = None
+
+    def __init__(self, renderer, loop_lag):
+        self.renderer = renderer
+        self.loop_lag = loop_lag
+        self.decisions = Counter()  # reason -> number of intervals chosen
+        self._interval_totals = Counter()  # reason -> sum of chosen intervals
+
+    def interval(self, timer, remaining):
+        raise NotImplementedError
+
+    def _decide(self, reason, interval):
+        self.decisions[reason] += 1
+        self._interval_totals[reason] += interval
+        return interval
+
+    def stats(self):
+        return {
+            'policy': self.name,
+            'decisions': dict(self.decisions),
+            'mean_interval': {
+                reason: round(self._interval_totals[reason] / count, 2) for reason, count in self.decisions.items()
+            }
+        }
+
+
+class FixedRefreshPolicy(RefreshPolicy):
+    """Every 5s, every 2s in the last minute, stretched only when the edit budget runs out"""
+
+    name = 'fixed'
+
+    def interval(self, timer, remaining):
+        reason, base = ('final_minute', 2) if remaining < 60 else ('normal', 5)
+        return self._decide(reason, self.renderer.refresh_interval(timer.channel_id, base))
+
+
+class AdaptiveRefreshPolicy(RefreshPolicy):
+    """Stretch refresh intervals with load before Discord starts throttling.
+
+    Pressure grows with event-loop lag, recent 429s and the share of the global
+    edit budget in use (from LOAD_TARGET onwards). Timers in their final
+    minute or touched in the last INTERACTION_WINDOW seconds ignore pressure;
+    timers more than a few minutes out absorb most of it.
+    """
+
+    name = 'adaptive'
+
+    LAG_TARGET = 0.05  # Lag the loop can absorb before intervals stretch
+    RATE_LIMIT_WINDOW = 60
+    LOAD_TARGET = 0.7  # Share of the global edit budget to stay under
+    INTERACTION_WINDOW = 30
+    MAX_INTERVAL = 30
+
+    def pressure(self, base):
+        """Multiplier (>= 1) applied to the base interval of timers that can wait"""
+        lag = 1 + max(0.0, self.loop_lag.lag - self.LAG_TARGET) / self.LAG_TARGET
+        rate_limits = 1 + self.renderer.recent_rate_limits(self.RATE_LIMIT_WINDOW) / 10
+        load = max(1.0, self.renderer.load(base) / self.LOAD_TARGET)
+        return lag * rate_limits * load
+
+    def interval(self, timer, remaining):
+        if remaining < 60:
+            reason, base, pressure = 'final_minute', 2, 1.0
+        elif time.time() - timer.touched_at < self.INTERACTION_WINDOW:
+            reason, base, pressure = 'interaction', 2, 1.0
+        elif remaining < 300:
+            reason, base = 'near', 5
+            pressure = self.pressure(base) ** 0.5
+        else:
+            reason, base = 'distant', 5
+            pressure = self.pressure(base)
+        
+        if pressure > 1.0:
+            reason += '_degraded'
+        interval = min(base * pressure, self.MAX_INTERVAL)
+        # The per-channel and global budgets still apply to everyone
+        return self._decide(reason, self.renderer.refresh_interval(timer.channel_id, interval))
+
+    def stats(self):
+        stats = super().stats()
+        stats['recent_rate_limits'] = self.renderer.recent_rate_limits(self.RATE_LIMIT_WINDOW)
+        stats['pressure'] = round(self.pressure(5), 2)
+        return stats
+
+
+REFRESH_POLICIES = {policy.name: policy for policy in (FixedRefreshPolicy, AdaptiveRefreshPolicy)}
+
+# --------- TIMER REGISTRY ---------
+class TimerRegistry:
+    """Active timers by ID, with secondary indexes by owner, guild, channel and message.
+
+    Every index is updated in add() and remove(), so lookups cost the size of
+    the result rather than a scan over all timers. Timers parked in SQLite
+    beyond MEMORY_HORIZON are only counted, so limits still see them, and so
+    are timers still being created (see reserve()).
+    """
+
+    def __init__(self):
+        self._timers = {}
+        self._by_user = {}
+        self._by_guild = {}
+        self._by_channel = {}
+        self._by_message = {}
+        self._parked = {}  # timer_id -> (user_id, guild_id, message_id) of timers that live only in SQLite
+        self._parked_messages = {}
+        self._parked_users = Counter()
+        self._parked_guilds = Counter()
+        self._pending_users = Counter()  # Timers reserved but not yet added or parked
+        self._pending_guilds = Counter()
+
+    @staticmethod
+    def _index(index, key, timer_id):
+        if key is not None:
+            index.setdefault(key, set()).add(timer_id)
+
+    @staticmethod
+    def _unindex(index, key, timer_id):
+        ids = index.get(key)
+        if ids is not None:
+            ids.discard(timer_id)
+            if not ids:
+                del index[key]
+
+    def add(self, timer):
+        timer_id = timer.id
+        if timer_id in self._timers:
+            self.remove(timer_id)
+        self.unpark(timer_id)
+        self._timers[timer_id] = timer
+        self._index(self._by_user, timer.user_id, timer_id)
+        self._index(self._by_guild, timer.guild_id, timer_id)
+        self._index(self._by_channel, timer.channel_id, timer_id)
+        self._by_message[timer.message_id] = timer_id
+
+    def remove(self, timer_id):
+        """Drop a timer from the registry and return it (None if it was not there)"""
+        timer = self._timers.pop(timer_id, None)
+        if timer is None:
+            return None
+        self._unindex(self._by_user, timer.user_id, timer_id)
+        self._unindex(self._by_guild, timer.guild_id, timer_id)
+        self._unindex(self._by_channel, timer.channel_id, timer_id)
+        if self._by_message.get(timer.message_id) == timer_id:
+            del self._by_message[timer.message_id]
+        return timer
+
+    def park(self, timer_id, user_id, guild_id, message_id):
+        """Count a timer that is stored in SQLite but not loaded"""
+        if timer_id in self._parked or timer_id in self._timers:
+            return
+        self._parked[timer_id] = (user_id, guild_id, message_id)
+        self._parked_messages[message_id] = timer_id
+        self._parked_users[user_id] += 1
+        if guild_id is not None:
+            self._parked_guilds[guild_id] += 1
+
+    def unpark(self, timer_id):
+        owner = self._parked.pop(timer_id, None)
+        if owner is None:
+            return
+        user_id, guild_id, message_id = owner
+        self._parked_messages.pop(message_id, None)
+        self._parked_users[user_id] -= 1
+        if not self._parked_users[user_id]:
+            del self._parked_users[user_id]
+        if guild_id is not None:
+            self._parked_guilds[guild_id] -= 1
+            if not self._parked_guilds[guild_id]:
+                del self._parked_guilds[guild_id]
+
+    def get(self, timer_id, default=None):
+        return self._timers.get(timer_id, default)
+
+    def __getitem__(self, timer_id):
+        return self._timers[timer_id]
+
+    def __contains__(self, timer_id):
+        return timer_id in self._timers
+
+    def __len__(self):
+        return len(self._timers)
+
+    def __iter__(self):
+        return iter(self._timers)
+
+    def items(self):
+        return self._timers.items()
+
+    def values(self):
+        return self._timers.values()
+
+    @property
+    def parked(self):
+        return len(self._parked)
+
+    def by_user(self, user_id):
+        return [(timer_id, self._timers[timer_id]) for timer_id in self._by_user.get(user_id, ())]
+
+    def by_guild(self, guild_id):
+        return [(timer_id, self._timers[timer_id]) for timer_id in self._by_guild.get(guild_id, ())]
+
+    def by_channel(self, channel_id):
+        return [(timer_id, self._timers[timer_id]) for timer_id in self._by_channel.get(channel_id, ())]
+
+    def by_message(self, message_id):
+        return self._by_message.get(message_id)
+
+    def parked_by_message(self, message_id):
+        return self._parked_messages.get(message_id)
+
+    def count_user(self, user_id):
+        """Active, parked and reserved timers of a user"""
+        return len(self._by_user.get(user_id, ())) + self._parked_users[user_id] + self._pending_users[user_id]
+
+    def count_guild(self, guild_id):
+        """Active, parked and reserved timers of a guild"""
+        return len(self._by_guild.get(guild_id, ())) + self._parked_guilds[guild_id] + self._pending_guilds[guild_id]
+
+    def reserve(self, user_id, guild_id):
+        """Count a timer that is being created towards the limits until release()"""
+        self._pending_users[user_id] += 1
+        if guild_id is not None:
+            self._pending_guilds[guild_id] += 1
+
+    def release(self, user_id, guild_id):
+        self._pending_users[user_id] -= 1
+        if not self._pending_users[user_id]:
+            del self._pending_users[user_id]
+        if guild_id is not None:
+            self._pending_guilds[guild_id] -= 1
+            if not self._pending_guilds[guild_id]:
+                del self._pending_guilds[guild_id]
+
+    def limit_reached(self, user_id, guild_id):
+        """Arabic reason the owner cannot start another timer, or None"""
+        if self.count_user(user_id) >= MAX_TIMERS_PER_USER:
+            return f"وصلت للحد الأقصى من التايمرات النشطة ({MAX_TIMERS_PER_USER})"
+        if guild_id is not None and self.count_guild(guild_id) >= MAX_TIMERS_PER_GUILD:
+            return f"وصل السيرفر للحد الأقصى من التايمرات النشطة ({MAX_TIMERS_PER_GUILD})"
+        return None
+
+# --------- COMPLETIONS ---------
+class CompletionDispatcher:
+    """Finish timers and cycle phases in batches so a burst of them costs few requests.
+
+    Timers that complete and phases that end within WINDOW of each other are
+    recorded in one transaction, final embeds go through the render scheduler,
+    and each channel gets a single ping that mentions every owner. Pings queue
+    for the render scheduler's send budget, and completions that arrive while
+    a channel's ping is still queued join it instead of sending another one.
+    """
+
+    WINDOW = 0.25
+    MAX_MESSAGE = 2000  # Discord's message length limit
+
+    def __init__(self):
+        self._pending = {}  # channel_id -> [(timer, late, due, note)]; note is None for a finished timer
+        self._phases = []  # History rows of the phases ended since the last flush
+        self._ids = set()
+        self._unsent = {}  # channel_id -> batch of the ping still waiting for its turn
+        self._flush_handle = None
+        self.batches = 0
+        self.completed = 0
+        self.phases = 0
+
+    def __contains__(self, timer_id):
+        return timer_id in self._ids
+
+    def _queue(self, timer, late, note):
+        self._pending.setdefault(timer.channel_id, []).append((timer, late, timer.end_time, note))
+        if self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(self.WINDOW, self.flush)
+
+    def complete(self, timer, late=False):
+        """Queue a finished timer; it must already be out of the registry"""
+        self._ids.add(timer.id)
+        self._queue(timer, late, None)
+
+    def phase_done(self, timer, late=False):
+        """Queue the current phase of a cycle timer as finished, before it moves to the next one"""
+        self._phases.append((timer.user_id, timer.total_seconds, timer.message, True))
+        self._queue(timer, late, phase_end_note(timer.cycle, timer.cycle.phase))
+
+    def flush(self):
+        self._flush_handle = None
+        pending, self._pending = self._pending, {}
+        phases, self._phases = self._phases, []
+        if not pending:
+            return
+
+        if phases:
+            advanced = {timer.id: timer for batch in pending.values() for timer, _, _, note in batch if note}
+            record_phases(phases, list(advanced.values()))
+            self.phases += len(phases)
+
+        timers = [timer for batch in pending.values() for timer, _, _, note in batch if note is None]
+        if timers:
+            future = finish_timers(timers, True)
+            future.add_done_callback(lambda _: self._ids.difference_update(timer.id for timer in timers))
+            self.completed += len(timers)
+        self.batches += 1
+
+        for channel_id, batch in pending.items():
+            for timer, late, _, note in batch:
+                if note is None:
+                    notify_completion(timer, late)
+            self._ping(channel_id, batch)
+
+    def _ping(self, channel_id, batch):
+        waiting = self._unsent.get(channel_id)
+        if waiting is not None:
+            waiting.extend(batch)
+            return
+        self._unsent[channel_id] = batch
+        future = bot.renderer.send_message(channel_id, functools.partial(self._send_pings, channel_id, batch, []))
+        future.add_done_callback(log_ping_failure)
+
+    async def _send_pings(self, channel_id, batch, contents):
+        """Send a channel's ping; `contents` is filled on the first try and reused on retries"""
+        if self._unsent.get(channel_id) is batch:
+            del self._unsent[channel_id]  # From here on, new completions start a new ping
+        if not contents:
+            contents.extend(completion_pings(batch))
+        
+        if len(batch) == 1:
+            # A lone timer keeps replying to its own message
+            await batch[0][0].msg.reply(contents[0])
+        else:
+            channel = bot.get_partial_messageable(channel_id, guild_id=batch[0][0].guild_id)
+            await channel.send(contents[0])
+            for content in contents[1:]:
+                bot.renderer.send_message(channel_id, functools.partial(channel.send, content)).add_done_callback(
+                    log_ping_failure
+                )
         
-    except (ValueError, AttributeError) as e:
-        logger.error(f"Error parsing time '{time_str}': {e}")
-        raise ValueError(f"صيغة الوقت غير صحيحة: {time_str}\nاستخدم: 5m, 2h, 30s, أو 1h30m")
+        # Timers that expired while the bot was down would only measure the downtime
+        now = time.time()
+        for _, late, due, _ in batch:
+            if not late:
+                completion_lateness_seconds.observe(now - due)
+
+
+def completion_pings(batch):
+    """Completion and phase messages for one channel, split to fit Discord's length limit"""
+    if len(batch) == 1:
+        timer, _, _, note = batch[0]
+        if note is None:
+            note = "انتهت الدورة!" if timer.cycle else "انتهى وقت التايمر!"
+        return [f"🔔 <@{timer.user_id}> {note} {timer.message or ''}"]
+
+    if any(note for _, _, _, note in batch):
+        lines = [f"🔔 {len(batch)} تنبيهات!"]
+    else:
+        lines = [f"🔔 انتهى وقت {len(batch)} تايمرات!"]
+    lines += [f"• <@{timer.user_id}> {note + ' ' if note else ''}{timer.message or ''}" for timer, _, _, note in batch]
+
+    chunks = ['']
+    for line in lines:
+        line = line[:CompletionDispatcher.MAX_MESSAGE - 1]
+        if len(chunks[-1]) + len(line) + 1 > CompletionDispatcher.MAX_MESSAGE:
+            chunks.append('')
+        chunks[-1] += line + '\n'
+    return chunks
+
+def log_ping_failure(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error(f"Error sending completion: {future.exception()}")
 
-def format_time(seconds):
-    """Format seconds to readable Arabic time"""
+# --------- COMMAND SYNC ---------
+# Syncing is a slow, globally rate-limited call, so it only runs when the tree changed
+DEV_GUILD_ID = int(os.environ.get("DEV_GUILD_ID", 0))  # Sync to this server only, where updates show at once
+FORCE_COMMAND_SYNC = os.environ.get("FORCE_COMMAND_SYNC", "0") == "1"
+
+def command_tree_hash(tree, guild=None):
+    """Stable hash of the command payloads Discord would receive (names, descriptions, options, choices)"""
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands(guild=guild)), key=lambda c: c['name'])
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, ensure_ascii=False).encode()).hexdigest()
+
+async def sync_command_tree(tree):
+    """Sync slash commands unless the stored hash shows Discord already has this tree"""
+    guild = discord.Object(id=DEV_GUILD_ID) if DEV_GUILD_ID else None
+    if guild:
+        tree.copy_global_to(guild=guild)
+    scope = f"guild:{DEV_GUILD_ID}" if guild else 'global'
+    
+    tree_hash = command_tree_hash(tree, guild)
+    if not FORCE_COMMAND_SYNC and await get_command_hash(scope) == tree_hash:
+        logger.info(f"⏭️ Slash commands unchanged ({scope}), skipping sync")
+        return False
+    
     try:
-        seconds = int(seconds)
-        hours = seconds // 3600
-        minutes = (seconds % 3600) // 60
-        secs = seconds % 60
-        
-        parts = []
-        if hours > 0:
-            parts.append(f"{hours}س")
-        if minutes > 0:
-            parts.append(f"{minutes}د")
-        if secs > 0 or len(parts) == 0:
-            parts.append(f"{secs}ث")
-        
-        return " ".join(parts)
+        await tree.sync(guild=guild)
+        await set_command_hash(scope, tree_hash)
+        logger.info(f"✅ Slash commands synced successfully ({scope})!")
+        return True
     except Exception as e:
-        logger.error(f"Error formatting time: {e}")
-        return "Unknown"
-
-def validate_duration(seconds):
-    """Validate timer duration"""
-    if seconds <= 0:
-        raise ValueError("المدة يجب أن تكون أكبر من 0")
-    if seconds > 86400:  # Max 24 hours
-        raise ValueError("الحد الأقصى 24 ساعة")
-    if seconds < 10:  # Min 10 seconds
-        raise ValueError("الحد الأدنى 10 ثواني")
-    return True
+        logger.error(f"❌ Error syncing commands: {e}")
+        logger.error(traceback.format_exc())
+        return False
 
 # --------- DISCORD BOT ---------
 intents = discord.Intents.default()
 intents.message_content = True
 
-class TimerBot(commands.Bot):
+class TimerBot(discord.Client):
     def __init__(self):
-        super().__init__(command_prefix="!", intents=intents)
-        self.active_timers = {}
+        super().__init__(intents=intents)
+        self.tree = app_commands.CommandTree(self)  # Slash commands only, so no need for discord.ext.commands
+        self.active_timers = TimerRegistry()
+        self.scheduler = TimerScheduler(self)
+        self.renderer = RenderScheduler()
+        self.completions = CompletionDispatcher()
+        self.loop_lag = LoopLagMonitor()
+        self.refresh_policy = REFRESH_POLICIES.get(REFRESH_POLICY, AdaptiveRefreshPolicy)(self.renderer, self.loop_lag)
         
     async def setup_hook(self):
-        try:
-            await self.tree.sync()
-            logger.info("✅ Slash commands synced successfully!")
-        except Exception as e:
-            logger.error(f"❌ Error syncing commands: {e}")
-            logger.error(traceback.format_exc())
+        # Login waits for this hook, so it only starts what handling events needs
+        await db.start()
+        self.renderer.start()
+        self.loop_lag.start()
+        self.add_dynamic_items(TimerButton)
+        self.scheduler.start()
+        
+        # Everything else runs alongside the gateway connection
+        self.web_task = asyncio.create_task(self.start_web())
+        self.prewarm_task = asyncio.create_task(prewarm_theme_cache())
+        self.sync_task = asyncio.create_task(sync_command_tree(self.tree))
+        self.maintenance_task = asyncio.create_task(history_maintenance_loop())
+    
+    async def start_web(self):
+        self.web_runner = await start_web_server()
+    
+    async def close(self):
+        await super().close()
+        if getattr(self, 'web_runner', None):
+            await self.web_runner.cleanup()
+        await db.close()  # Flush queued writes
 
 bot = TimerBot()
 
 # --------- TIMER VIEW ---------
-class TimerView(discord.ui.View):
-    def __init__(self, timer_id, bot_instance):
-        super().__init__(timeout=None)
+TIMER_BUTTONS = {
+    # action: (label, style, emoji)
+    'pause': ("إيقاف مؤقت", discord.ButtonStyle.primary, "⏸️"),
+    'resume': ("استئناف", discord.ButtonStyle.success, "▶️"),
+    'cancel': ("إلغاء", discord.ButtonStyle.danger, "❌"),
+    'extend': ("+5 دقائق", discord.ButtonStyle.success, "➕")
+}
+
+class TimerButton(discord.ui.DynamicItem[discord.ui.Button], template=r'timer:(?P<action>pause|resume|cancel|extend):(?P<timer_id>\w+)'):
+    """Timer control button whose custom_id carries the timer ID.
+
+    Registered once in setup_hook, so buttons keep working after a restart
+    and no per-timer view has to be kept in memory.
+    """
+
+    def __init__(self, action, timer_id):
+        label, style, emoji = TIMER_BUTTONS[action]
+        super().__init__(discord.ui.Button(
+            label=label, style=style, emoji=emoji, custom_id=f"timer:{action}:{timer_id}"
+        ))
+        self.action = action
         self.timer_id = timer_id
-        self.bot = bot_instance
-        
-    @discord.ui.button(label="إيقاف مؤقت", style=discord.ButtonStyle.primary, emoji="⏸️")
-    async def pause_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+
+    @classmethod
+    async def from_custom_id(cls, interaction, item, match):
+        return cls(match['action'], match['timer_id'])
+
+    async def callback(self, interaction: discord.Interaction):
+        started = time.perf_counter()
         try:
-            if self.timer_id not in self.bot.active_timers:
+            # Parked timers are only loaded back into memory for their owner
+            owner = await bot.scheduler.ensure_loaded(self.timer_id, interaction.user.id)
+            if owner is None:
                 await interaction.response.send_message("❌ التايمر غير موجود", ephemeral=True)
                 return
-                
-            timer = self.bot.active_timers[self.timer_id]
             
             # Check if user owns this timer
-            if timer['user'].id != interaction.user.id:
+            if owner != interaction.user.id:
                 await interaction.response.send_message("❌ هذا التايمر ليس لك", ephemeral=True)
                 return
             
-            timer['paused'] = not timer.get('paused', False)
+            timer = bot.active_timers[self.timer_id]
             
-            if timer['paused']:
-                button.label = "استئناف"
-                button.emoji = "▶️"
-                button.style = discord.ButtonStyle.success
-                await interaction.response.edit_message(view=self)
-                await interaction.followup.send("⏸️ تم إيقاف التايمر مؤقتاً", ephemeral=True)
+            timer.touched_at = time.time()
+            if self.action in ('pause', 'resume'):
+                if self.action == 'pause':
+                    pause_timer(timer)
+                else:
+                    resume_timer(timer)
+                await interaction.response.edit_message(view=timer_view(timer.id, timer.paused))
+                if timer.paused:
+                    await interaction.followup.send("⏸️ تم إيقاف التايمر مؤقتاً", ephemeral=True)
+                else:
+                    await interaction.followup.send("▶️ تم استئناف التايمر", ephemeral=True)
+            elif self.action == 'cancel':
+                cancel_timer(timer)
+                await interaction.response.send_message("✅ تم إلغاء التايمر", ephemeral=True)
             else:
-                button.label = "إيقاف مؤقت"
-                button.emoji = "⏸️"
-                button.style = discord.ButtonStyle.primary
-                await interaction.response.edit_message(view=self)
-                await interaction.followup.send("▶️ تم استئناف التايمر", ephemeral=True)
-                
-        except Exception as e:
-            logger.error(f"Error in pause button: {e}")
-            logger.error(traceback.format_exc())
-            try:
-                await interaction.response.send_message(f"❌ حدث خطأ: {str(e)}", ephemeral=True)
-            except:
-                pass
-    
-    @discord.ui.button(label="إلغاء", style=discord.ButtonStyle.danger, emoji="❌")
-    async def cancel_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        try:
-            if self.timer_id not in self.bot.active_timers:
-                await interaction.response.send_message("❌ التايمر غير موجود", ephemeral=True)
-                return
-                
-            timer = self.bot.active_timers[self.timer_id]
-            
-            # Check if user owns this timer
-            if timer['user'].id != interaction.user.id:
-                await interaction.response.send_message("❌ هذا التايمر ليس لك", ephemeral=True)
-                return
-            
-            self.bot.active_timers[self.timer_id]['cancelled'] = True
-            await interaction.response.send_message("✅ تم إلغاء التايمر", ephemeral=True)
-            
-        except Exception as e:
-            logger.error(f"Error in cancel button: {e}")
-            logger.error(traceback.format_exc())
-            try:
-                await interaction.response.send_message(f"❌ حدث خطأ: {str(e)}", ephemeral=True)
-            except:
-                pass
-    
-    @discord.ui.button(label="+5 دقائق", style=discord.ButtonStyle.success, emoji="➕")
-    async def add_time_button(self, interaction: discord.Interaction, button: discord.ui.Button):
-        try:
-            if self.timer_id not in self.bot.active_timers:
-                await interaction.response.send_message("❌ التايمر غير موجود", ephemeral=True)
-                return
+                extend_timer(timer, 300)
+                await interaction.response.send_message("✅ تم إضافة 5 دقائق", ephemeral=True)
                 
-            timer = self.bot.active_timers[self.timer_id]
-            
-            # Check if user owns this timer
-            if timer['user'].id != interaction.user.id:
-                await interaction.response.send_message("❌ هذا التايمر ليس لك", ephemeral=True)
-                return
-            
-            self.bot.active_timers[self.timer_id]['end_time'] += 300
-            self.bot.active_timers[self.timer_id]['total_seconds'] += 300
-            await interaction.response.send_message("✅ تم إضافة 5 دقائق", ephemeral=True)
-            
         except Exception as e:
-            logger.error(f"Error in add time button: {e}")
+            logger.error(f"Error in {self.action} button: {e}")
             logger.error(traceback.format_exc())
             try:
                 await interaction.response.send_message(f"❌ حدث خطأ: {str(e)}", ephemeral=True)
             except:
                 pass
+        finally:
+            command_seconds.observe(time.perf_counter() - started, f"button_{self.action}")
 
-# --------- ERROR HANDLER ---------
-@bot.event
-async def on_command_error(ctx, error):
-    logger.error(f"Command error: {error}")
-    logger.error(traceback.format_exc())
+def timer_view(timer_id, paused=False):
+    """Control buttons of a timer message"""
+    view = discord.ui.View(timeout=None)
+    view.add_item(TimerButton('resume' if paused else 'pause', timer_id))
+    view.add_item(TimerButton('cancel', timer_id))
+    view.add_item(TimerButton('extend', timer_id))
+    # Clicks are routed by custom_id to TimerButton; a stopped view is not kept in the view store
+    view.stop()
+    return view
 
+# --------- ERROR HANDLER ---------
 @bot.tree.error
 async def on_app_command_error(interaction: discord.Interaction, error: app_commands.AppCommandError):
     logger.error(f"App command error: {error}")
@@ -536,15 +2677,61 @@ async def on_ready():
     except Exception as e:
         logger.error(f"Error setting presence: {e}")
 
+def drop_deleted_messages(message_ids):
+    """Forget the timers whose display messages were deleted"""
+    parked = []
+    for message_id in message_ids:
+        timer_id = bot.active_timers.by_message(message_id)
+        if timer_id is not None:
+            drop_timer(timer_id)
+        timer_id = bot.active_timers.parked_by_message(message_id)
+        if timer_id is not None:
+            bot.active_timers.unpark(timer_id)
+            parked.append(timer_id)
+    if parked:
+        logger.warning(f"Scheduled timer messages deleted: {parked}")
+        delete_timers(parked)
+
+async def drop_timers_in(column, value, timers):
+    """Forget every timer of a deleted channel or a guild the bot left"""
+    for timer_id, _ in timers:
+        drop_timer(timer_id)
+    if bot.active_timers.parked:
+        for timer_id in await delete_timers_in(column, value) or ():
+            bot.active_timers.unpark(timer_id)
+
+@bot.event
+async def on_raw_message_delete(payload):
+    drop_deleted_messages((payload.message_id,))
+
+@bot.event
+async def on_raw_bulk_message_delete(payload):
+    drop_deleted_messages(payload.message_ids)
+
+@bot.event
+async def on_guild_channel_delete(channel):
+    await drop_timers_in('channel_id', channel.id, bot.active_timers.by_channel(channel.id))
+
+@bot.event
+async def on_raw_thread_delete(payload):
+    await drop_timers_in('channel_id', payload.thread_id, bot.active_timers.by_channel(payload.thread_id))
+
+@bot.event
+async def on_guild_remove(guild):
+    await drop_timers_in('guild_id', guild.id, bot.active_timers.by_guild(guild.id))
+
 # --------- TIMER COMMAND ---------
 @bot.tree.command(name="timer", description="ابدأ تايمر جديد")
 @app_commands.describe(
-    duration="المدة (مثال: 5m, 2h, 30s, 1h30m)",
-    message="رسالة التذكير (اختياري)"
+    duration="المدة (مثال: 5m, 2h, 1h30m, 1.5h, 25 دقيقة)",
+    message="رسالة التذكير (اختياري)",
+    repeat="كرر التايمر بنفس المدة عدة مرات في نفس الرسالة (اختياري)"
 )
-async def timer_command(interaction: discord.Interaction, duration: str, message: str = None):
+@timed("timer")
+async def timer_command(interaction: discord.Interaction, duration: str, message: str = None,
+                        repeat: app_commands.Range[int, 1, MAX_CYCLE_ROUNDS] = 1):
     try:
-        logger.info(f"Timer command: user={interaction.user.name}, duration={duration}, message={message}")
+        logger.info(f"Timer command: user={interaction.user.name}, duration={duration}, message={message}, repeat={repeat}")
         
         # Parse and validate duration
         total_seconds = parse_time(duration)
@@ -552,73 +2739,431 @@ async def timer_command(interaction: discord.Interaction, duration: str, message
         
         logger.info(f"Parsed duration: {total_seconds} seconds")
         
-        # Get user theme from database
-        theme_name = get_user_theme(interaction.user.id)
-        theme = THEMES.get(theme_name, THEMES['dark'])
-        
-        # Create timer ID
-        timer_id = f"{interaction.user.id}_{int(time.time())}"
+        cycle = Cycle(total_seconds, 0, repeat) if repeat > 1 else None
+        if cycle:
+            validate_cycle(cycle)
         
-        # Create initial embed
-        embed = discord.Embed(
-            title=f"{theme['emoji']} تايمر جديد",
-            description=message or "⏰ تايمر قيد التشغيل...",
-            color=theme['color']
-        )
+        await start_timer(interaction, total_seconds, message, cycle)
         
-        # Initial time display
-        minutes = total_seconds // 60
-        seconds = total_seconds % 60
-        ascii_time = create_ascii_time(minutes, seconds)
+    except ValueError as e:
+        error_msg = f"❌ {str(e)}\n\n**أمثلة صحيحة:**\n• `5m` = 5 دقائق\n• `2h` = ساعتين\n• `30s` = 30 ثانية\n• `1h30m` = ساعة ونصف\n• `1.5h` = ساعة ونصف\n• `٢٥ دقيقة` = 25 دقيقة"
+        await interaction.response.send_message(error_msg, ephemeral=True)
+    except Exception as e:
+        logger.error(f"Error in timer command: {e}")
+        logger.error(traceback.format_exc())
         
+        error_msg = f"❌ حدث خطأ: {str(e)}"
+        try:
+            if interaction.response.is_done():
+                await interaction.followup.send(error_msg, ephemeral=True)
+            else:
+                await interaction.response.send_message(error_msg, ephemeral=True)
+        except:
+            pass
+
+async def start_timer(interaction, total_seconds, message=None, cycle=None):
+    """Post the display message of a new timer and hand it to the scheduler.
+
+    `total_seconds` is the length of the first phase when `cycle` is given.
+    """
+    user_id, guild_id = interaction.user.id, interaction.guild_id
+    limit = bot.active_timers.limit_reached(user_id, guild_id)
+    if limit:
+        await interaction.response.send_message(f"❌ {limit}", ephemeral=True)
+        return
+    
+    # Hold the slot across the awaits below, so concurrent commands cannot all pass the check
+    bot.active_timers.reserve(user_id, guild_id)
+    try:
+        await post_timer(interaction, total_seconds, message, cycle)
+    finally:
+        bot.active_timers.release(user_id, guild_id)
+
+async def post_timer(interaction, total_seconds, message, cycle):
+    """The part of start_timer that runs while the timer's slot is reserved"""
+    # Get user theme and display mode from database
+    theme_name = await get_user_theme(interaction.user.id)
+    theme = THEMES.get(theme_name, THEMES['dark'])
+    display_mode = await get_user_display(interaction.user.id)
+    
+    # Create timer ID
+    timer_id = new_timer_id()
+    
+    # Create initial embed
+    embed = discord.Embed(
+        title=phase_title(cycle, theme) if cycle else f"{theme['emoji']} تايمر جديد",
+        description=message or "⏰ تايمر قيد التشغيل...",
+        color=theme['color']
+    )
+    
+    # Initial time display
+    end_timestamp = int(time.time() + total_seconds)
+    if display_mode == 'native':
+        embed.add_field(name="الوقت المتبقي", value=f"<t:{end_timestamp}:R>", inline=False)
+    else:
         embed.add_field(
             name="الوقت المتبقي",
-            value=f"```\n{ascii_time}\n```",
+            value=create_clock_block(total_seconds),
             inline=False
         )
         
         progress = create_progress_bar(total_seconds, total_seconds)
         embed.add_field(name="التقدم", value=progress, inline=False)
-        embed.add_field(name="المدة الكلية", value=format_time(total_seconds), inline=True)
-        embed.add_field(name="بدأ في", value=f"<t:{int(time.time())}:T>", inline=True)
+    embed.add_field(name="المدة الكلية", value=format_time(total_seconds), inline=True)
+    embed.add_field(name="بدأ في", value=f"<t:{int(time.time())}:T>", inline=True)
+    if cycle:
+        embed.add_field(name="الدورة", value=f"{cycle.phases} مراحل - {format_time(cycle.total_seconds)}", inline=True)
+    
+    # Long timers are not re-rendered until they approach, so show a native countdown
+    if display_mode == 'native' or total_seconds > LIVE_WINDOW:
+        embed.add_field(name="ينتهي", value=f"<t:{end_timestamp}:F> (<t:{end_timestamp}:R>)", inline=False)
+    
+    # Add footer
+    if interaction.user.avatar:
+        embed.set_footer(text=f"طلب بواسطة {interaction.user.name}", icon_url=interaction.user.avatar.url)
+    else:
+        embed.set_footer(text=f"طلب بواسطة {interaction.user.name}")
+    
+    # Send message
+    await interaction.response.send_message(embed=embed, view=timer_view(timer_id))
+    msg = await interaction.original_response()
+    
+    # Store timer info by ID only; the message is edited through the channel, not the interaction
+    timer = Timer(
+        timer_id,
+        user_id=interaction.user.id,
+        guild_id=interaction.guild_id,
+        channel_id=msg.channel.id,
+        message_id=msg.id,
+        end_time=time.time() + total_seconds,
+        total_seconds=total_seconds,
+        message=message,
+        theme_name=theme_name,
+        user_name=interaction.user.name,
+        avatar_url=interaction.user.avatar.url if interaction.user.avatar else None,
+        display_mode=display_mode,
+        cycle=cycle
+    )
+    saved = await save_timer(timer)
+    
+    # Far-future timers are parked in the database and loaded as they approach
+    if total_seconds > MEMORY_HORIZON and saved:
+        bot.active_timers.park(timer_id, timer.user_id, timer.guild_id, timer.message_id)
+        logger.info(f"Timer {timer_id} scheduled in database")
+        return
+    
+    bot.active_timers.add(timer)
+    logger.info(f"Timer {timer_id} created successfully")
+    
+    # Hand the timer to the scheduler
+    bot.scheduler.schedule(timer_id, next_timer_event(timer))
+
+def pause_timer(timer):
+    """Freeze a timer; it costs nothing until it is resumed"""
+    if timer.paused:
+        return
+    timer.paused = True
+    timer.pause_time = time.time()
+    bot.scheduler.unschedule(timer.id)
+    update_timer_state(timer)
+    if shows_countdown(timer):
+        # A native countdown keeps ticking on its own, so show the frozen time instead
+        submit_render(timer)
+
+def resume_timer(timer):
+    """Push the deadline back by the time spent paused and render right away"""
+    if not timer.paused:
+        return
+    if timer.pause_time > 0:
+        timer.end_time += time.time() - timer.pause_time
+    timer.paused = False
+    timer.pause_time = 0
+    update_timer_state(timer)
+    bot.scheduler.wake(timer.id)
+
+def cancel_timer(timer):
+    timer.cancelled = True
+    bot.scheduler.wake(timer.id)
+
+def extend_timer(timer, seconds):
+    timer.end_time += seconds
+    timer.total_seconds += seconds
+    update_timer_state(timer)
+    if timer.paused:
+        # process_timer does not render paused timers, so show the new time here
+        submit_render(timer)
+    bot.scheduler.wake(timer.id)
+
+async def process_timer(timer_id):
+    """Handle one due event of a timer and return when it is next due (None when finished)"""
+    timer = bot.active_timers.get(timer_id)
+    
+    if not timer:
+        logger.error(f"Timer {timer_id} not found")
+        return None
+    
+    # Check if cancelled
+    if timer.cancelled:
+        logger.info(f"Timer {timer_id} cancelled")
         
-        # Add footer
-        if interaction.user.avatar:
-            embed.set_footer(text=f"طلب بواسطة {interaction.user.name}", icon_url=interaction.user.avatar.url)
-        else:
-            embed.set_footer(text=f"طلب بواسطة {interaction.user.name}")
-        
-        # Create view
-        view = TimerView(timer_id, bot)
-        
-        # Send message
-        await interaction.response.send_message(embed=embed, view=view)
-        msg = await interaction.original_response()
-        
-        # Store timer info
-        bot.active_timers[timer_id] = {
-            'end_time': time.time() + total_seconds,
-            'total_seconds': total_seconds,
-            'message': message,
-            'user': interaction.user,
-            'msg': msg,
-            'theme': theme,
-            'paused': False,
-            'cancelled': False,
-            'pause_time': 0,
-            'created_at': time.time()
-        }
+        embed = discord.Embed(
+            title="❌ تم إلغاء التايمر",
+            description=timer.message or "التايمر ملغي",
+            color=0xFF0000
+        )
+        bot.renderer.submit(timer.msg, lambda: {'embed': embed, 'view': None}, final=True)
+        
+        # Save to history
+        finish_timers([timer], False)
+        bot.active_timers.remove(timer_id)
+        return None
+    
+    # Paused timers stay off the schedule until resume_timer wakes them
+    if timer.paused:
+        if timer.pause_time == 0:
+            timer.pause_time = time.time()
+            update_timer_state(timer)
+        return None
+    
+    # Calculate remaining time
+    remaining = int(timer.end_time - time.time())
+    
+    # Check if finished
+    if remaining <= 0:
+        # A cycle timer keeps its entry and message and moves on to its next phase
+        if timer.cycle is not None and next_phase(timer):
+            logger.info(f"Timer {timer_id} entered phase {timer.cycle.phase + 1}/{timer.cycle.phases}")
+            submit_render(timer)
+            return next_timer_event(timer)
+        
+        logger.info(f"Timer {timer_id} completed")
+        # Save to history and ping the owner together with other timers finishing now
+        bot.active_timers.remove(timer_id)
+        bot.completions.complete(timer)
+        return None
+    
+    # Queue a display update; the embed is built when the edit goes out
+    submit_render(timer)
+    
+    return next_timer_event(timer)
+
+def next_phase(timer, late=False):
+    """Record the ended phases of a cycle timer and move it to the phase running now.
+
+    Returns False when the last phase has ended as well, leaving the timer to be completed.
+    """
+    cycle = timer.cycle
+    now = time.time()
+    while timer.end_time <= now:
+        if cycle.phase + 1 >= cycle.phases:
+            return False
+        bot.completions.phase_done(timer, late)
+        cycle.phase += 1
+        timer.total_seconds = cycle.seconds(cycle.phase)
+        timer.end_time += timer.total_seconds  # From the previous deadline, so phases do not drift
+    timer.render_fields = None  # The title changed, so the next render rebuilds the embed
+    return True
+
+def submit_render(timer):
+    timer_id = timer.id
+    bot.renderer.submit(
+        timer.msg,
+        lambda: render_timer(timer_id),
+        on_missing=lambda: drop_timer(timer_id),
+        track=not shows_countdown(timer),
+        on_failed=lambda error: render_failed(timer_id, error)
+    )
+
+def render_failed(timer_id, error):
+    """Forget the display of an edit that did not go through, so the next render sends it in full"""
+    timer = bot.active_timers.get(timer_id)
+    if timer is None:
+        return
+    timer.render_fields = None
+    
+    # Countdowns only render on state changes, so nothing else would repair the message
+    transient = isinstance(error, (asyncio.TimeoutError, OSError)) or (
+        isinstance(error, discord.HTTPException) and (error.status == 429 or error.status >= 500)
+    )
+    if shows_countdown(timer) and transient:
+        submit_render(timer)
+
+def timer_message(channel_id, guild_id, message_id):
+    """Partial message for a timer display, usable without cache or interaction token"""
+    return bot.get_partial_messageable(channel_id, guild_id=guild_id).get_partial_message(message_id)
+
+def phase_title(cycle, theme):
+    """Embed title of a cycle timer in its current phase"""
+    phase = cycle.phase
+    if not cycle.rest:
+        return f"{theme['emoji']} 🔁 تكرار {phase + 1}/{cycle.rounds}"
+    if cycle.is_work(phase):
+        return f"{theme['emoji']} 🍅 وقت العمل - الجولة {cycle.round(phase)}/{cycle.rounds}"
+    return f"{theme['emoji']} ☕ استراحة - بعد الجولة {cycle.round(phase)}/{cycle.rounds}"
+
+def phase_end_note(cycle, phase):
+    """Ping text for the end of one phase of a cycle timer"""
+    if not cycle.rest:
+        return f"⏰ تذكير {phase + 1}/{cycle.rounds}"
+    if cycle.is_work(phase):
+        return f"انتهت الجولة {cycle.round(phase)}/{cycle.rounds}! ☕ استراحة {format_time(cycle.rest)}"
+    return f"انتهت الاستراحة! 🍅 الجولة {cycle.round(phase) + 1}/{cycle.rounds}"
+
+def notify_completion(timer, late=False):
+    """Queue the final embed of a finished timer"""
+    embed = discord.Embed(
+        title="🔔 انتهت الدورة!" if timer.cycle else "🔔 انتهى الوقت!",
+        description=timer.message or "⏰ انتهى التايمر!",
+        color=0x00FF00
+    )
+    embed.add_field(name="المستخدم", value=f"<@{timer.user_id}>", inline=False)
+    if timer.cycle:
+        embed.add_field(name="المراحل", value=str(timer.cycle.phases), inline=True)
+    embed.set_footer(text="✅ اكتمل أثناء توقف البوت" if late else "✅ اكتمل")
+    bot.renderer.submit(timer.msg, lambda: {'embed': embed, 'view': None}, final=True)
+
+# Live display fields as (name, inline); the warning field is only present near the thresholds
+TIMER_FIELDS = (
+    ("الوقت المتبقي", False),
+    ("التقدم", False),
+    ("المتبقي", True),
+    ("ينتهي في", True),
+    ("⚠️ تنبيه", False)
+)
+
+def timer_fields(timer, remaining):
+    """Visible field values of a running timer; doubles as the fingerprint of its display"""
+    # Warning messages
+    if remaining <= 60 and remaining > 55:
+        warning = "أقل من دقيقة!"
+    elif remaining <= 300 and remaining > 295:
+        warning = "أقل من 5 دقائق!"
+    else:
+        warning = None
+    
+    return (
+        create_clock_block(remaining),
+        create_progress_bar(remaining, timer.total_seconds),
+        format_time(remaining),
+        f"<t:{int(timer.end_time)}:T>",
+        warning
+    )
+
+# Fields of a native-countdown display, which is only rendered on state changes
+NATIVE_TIMER_FIELDS = (
+    ("الوقت المتبقي", False),
+    ("ينتهي في", True)
+)
+
+def shows_countdown(timer):
+    """Whether a timer is displayed as a native countdown: always in native mode, and
+    for live timers until they enter LIVE_WINDOW, since nothing re-renders them before"""
+    if timer.native:
+        return True
+    now = timer.pause_time if timer.paused and timer.pause_time else time.time()
+    return timer.end_time - now > LIVE_WINDOW
+
+def native_timer_fields(timer):
+    if timer.paused:
+        remaining = timer.end_time - (timer.pause_time or time.time())
+        return (f"⏸️ متوقف - متبقي **{format_time(max(0, remaining))}**", "-")
+    end_timestamp = int(timer.end_time)
+    return (f"<t:{end_timestamp}:R>", f"<t:{end_timestamp}:T>")
+
+def render_timer(timer_id):
+    """Build the display of a running timer (None if nothing visible changed)"""
+    timer = bot.active_timers.get(timer_id)
+    if not timer or timer.cancelled:
+        return None
+    
+    if shows_countdown(timer):
+        layout = NATIVE_TIMER_FIELDS
+        fields = native_timer_fields(timer)
+    else:
+        # A paused timer shows the time it had left when it was paused
+        now = timer.pause_time if timer.paused and timer.pause_time else time.time()
+        remaining = int(timer.end_time - now)
+        if remaining <= 0:
+            return None
+        layout = TIMER_FIELDS
+        fields = timer_fields(timer, remaining)
+    
+    if fields == timer.render_fields:
+        return None  # Same payload as the last edit
+    
+    # Rebuilt on every change rather than patched: a cached Embed would cost
+    # each running timer ~1.6 KB for a few microseconds saved per edit
+    theme = THEMES[timer.theme_name]
+    embed = discord.Embed(
+        title=phase_title(timer.cycle, theme) if timer.cycle else f"{theme['emoji']} تايمر قيد التشغيل",
+        description=timer.message or "⏰ تايمر قيد التشغيل...",
+        color=theme['color']
+    )
+    for (name, inline), value in zip(layout, fields):
+        if value is not None:
+            embed.add_field(name=name, value=value, inline=inline)
+    
+    if timer.avatar_url:
+        embed.set_footer(text=f"طلب بواسطة {timer.user_name}", icon_url=timer.avatar_url)
+    else:
+        embed.set_footer(text=f"طلب بواسطة {timer.user_name}")
+    
+    timer.render_fields = fields
+    return {'embed': embed}
+
+def drop_timer(timer_id):
+    """Forget a timer whose message was deleted"""
+    timer = bot.active_timers.remove(timer_id)
+    if timer is not None:
+        logger.warning(f"Timer message deleted: {timer_id}")
+        bot.scheduler.unschedule(timer_id)
+        bot.renderer.forget(timer.msg)
+        delete_timers([timer_id])
+
+def next_timer_event(timer):
+    """Next render or completion time of a running timer"""
+    now = time.time()
+    remaining = timer.end_time - now
+    
+    # Native countdowns tick client-side; only completion needs the scheduler
+    if timer.native:
+        return timer.end_time
+    
+    # Far-future timers stay dormant until they enter the live window
+    if remaining > LIVE_WINDOW:
+        return timer.end_time - LIVE_WINDOW
+    
+    update_interval = bot.refresh_policy.interval(timer, remaining)
+    return min(now + update_interval, timer.end_time)
+
+# --------- POMODORO COMMAND ---------
+@bot.tree.command(name="pomodoro", description="ابدأ دورة بومودورو: عمل واستراحة بالتناوب في رسالة واحدة")
+@app_commands.describe(
+    work="مدة العمل (افتراضياً 25m)",
+    rest="مدة الاستراحة (افتراضياً 5m)",
+    rounds="عدد جولات العمل (افتراضياً 4)",
+    message="رسالة التذكير (اختياري)"
+)
+@app_commands.rename(rest="break")
+@timed("pomodoro")
+async def pomodoro_command(interaction: discord.Interaction, work: str = "25m", rest: str = "5m",
+                           rounds: app_commands.Range[int, 1, MAX_CYCLE_ROUNDS] = 4, message: str = None):
+    try:
+        logger.info(f"Pomodoro command: user={interaction.user.name}, work={work}, break={rest}, rounds={rounds}")
         
-        logger.info(f"Timer {timer_id} created successfully")
+        work_seconds = parse_time(work)
+        validate_duration(work_seconds)
+        rest_seconds = parse_time(rest)
+        validate_duration(rest_seconds)
+        cycle = Cycle(work_seconds, rest_seconds, rounds)
+        validate_cycle(cycle)
         
-        # Start timer loop
-        bot.loop.create_task(run_timer(timer_id))
+        await start_timer(interaction, work_seconds, message, cycle)
         
     except ValueError as e:
-        error_msg = f"❌ {str(e)}\n\n**أمثلة صحيحة:**\n• `5m` = 5 دقائق\n• `2h` = ساعتين\n• `30s` = 30 ثانية\n• `1h30m` = ساعة ونصف"
-        await interaction.response.send_message(error_msg, ephemeral=True)
+        await interaction.response.send_message(f"❌ {str(e)}", ephemeral=True)
     except Exception as e:
-        logger.error(f"Error in timer command: {e}")
+        logger.error(f"Error in pomodoro command: {e}")
         logger.error(traceback.format_exc())
         
         error_msg = f"❌ حدث خطأ: {str(e)}"
@@ -630,162 +3175,26 @@ async def timer_command(interaction: discord.Interaction, duration: str, message
         except:
             pass
 
-async def run_timer(timer_id):
-    """Run the timer countdown with improved performance"""
-    try:
-        logger.info(f"Starting timer: {timer_id}")
-        timer = bot.active_timers.get(timer_id)
-        
-        if not timer:
-            logger.error(f"Timer {timer_id} not found")
-            return
-        
-        update_interval = 5  # Update every 5 seconds by default
-        last_update = 0
-        
-        while True:
-            try:
-                # Check if cancelled
-                if timer.get('cancelled'):
-                    logger.info(f"Timer {timer_id} cancelled")
-                    
-                    embed = discord.Embed(
-                        title="❌ تم إلغاء التايمر",
-                        description=timer['message'] or "التايمر ملغي",
-                        color=0xFF0000
-                    )
-                    
-                    try:
-                        await timer['msg'].edit(embed=embed, view=None)
-                    except:
-                        pass
-                    
-                    # Save to history
-                    save_timer_history(timer['user'].id, timer['total_seconds'], timer['message'], False)
-                    del bot.active_timers[timer_id]
-                    break
-                
-                # Handle pause
-                if timer.get('paused'):
-                    if timer['pause_time'] == 0:
-                        timer['pause_time'] = time.time()
-                    await asyncio.sleep(1)
-                    continue
-                elif timer['pause_time'] > 0:
-                    pause_duration = time.time() - timer['pause_time']
-                    timer['end_time'] += pause_duration
-                    timer['pause_time'] = 0
-                
-                # Calculate remaining time
-                remaining = int(timer['end_time'] - time.time())
-                
-                # Check if finished
-                if remaining <= 0:
-                    logger.info(f"Timer {timer_id} completed")
-                    
-                    embed = discord.Embed(
-                        title="🔔 انتهى الوقت!",
-                        description=timer['message'] or "⏰ انتهى التايمر!",
-                        color=0x00FF00
-                    )
-                    embed.add_field(name="المستخدم", value=timer['user'].mention, inline=False)
-                    embed.set_footer(text="✅ اكتمل")
-                    
-                    try:
-                        await timer['msg'].edit(embed=embed, view=None)
-                        await timer['msg'].reply(f"🔔 {timer['user'].mention} انتهى وقت التايمر! {timer['message'] or ''}")
-                    except Exception as e:
-                        logger.error(f"Error sending completion: {e}")
-                    
-                    # Save to history
-                    save_timer_history(timer['user'].id, timer['total_seconds'], timer['message'], True)
-                    del bot.active_timers[timer_id]
-                    break
-                
-                # Dynamic update interval
-                if remaining < 60:
-                    update_interval = 2  # Update every 2 seconds in last minute
-                else:
-                    update_interval = 5
-                
-                # Only update if enough time passed
-                current_time = time.time()
-                if current_time - last_update < update_interval:
-                    await asyncio.sleep(1)
-                    continue
-                
-                last_update = current_time
-                
-                # Update display
-                minutes = remaining // 60
-                seconds = remaining % 60
-                ascii_time = create_ascii_time(minutes, seconds)
-                
-                embed = discord.Embed(
-                    title=f"{timer['theme']['emoji']} تايمر قيد التشغيل",
-                    description=timer['message'] or "⏰ تايمر قيد التشغيل...",
-                    color=timer['theme']['color']
-                )
-                
-                embed.add_field(
-                    name="الوقت المتبقي",
-                    value=f"```\n{ascii_time}\n```",
-                    inline=False
-                )
-                
-                progress = create_progress_bar(remaining, timer['total_seconds'])
-                embed.add_field(name="التقدم", value=progress, inline=False)
-                embed.add_field(name="المتبقي", value=format_time(remaining), inline=True)
-                embed.add_field(name="ينتهي في", value=f"<t:{int(timer['end_time'])}:T>", inline=True)
-                
-                # Warning messages
-                if remaining <= 60 and remaining > 55:
-                    embed.add_field(name="⚠️ تنبيه", value="أقل من دقيقة!", inline=False)
-                elif remaining <= 300 and remaining > 295:
-                    embed.add_field(name="⚠️ تنبيه", value="أقل من 5 دقائق!", inline=False)
-                
-                if timer['user'].avatar:
-                    embed.set_footer(text=f"طلب بواسطة {timer['user'].name}", icon_url=timer['user'].avatar.url)
-                else:
-                    embed.set_footer(text=f"طلب بواسطة {timer['user'].name}")
-                
-                # Update message
-                try:
-                    await timer['msg'].edit(embed=embed)
-                except discord.NotFound:
-                    logger.warning(f"Timer message deleted: {timer_id}")
-                    del bot.active_timers[timer_id]
-                    break
-                except discord.HTTPException as e:
-                    logger.error(f"HTTP error updating timer: {e}")
-                    await asyncio.sleep(10)  # Wait longer on rate limit
-                except Exception as e:
-                    logger.error(f"Error updating timer: {e}")
-                
-                await asyncio.sleep(1)
-                
-            except Exception as e:
-                logger.error(f"Error in timer loop: {e}")
-                logger.error(traceback.format_exc())
-                await asyncio.sleep(5)
-            
-    except Exception as e:
-        logger.error(f"Fatal error in run_timer {timer_id}: {e}")
-        logger.error(traceback.format_exc())
-        if timer_id in bot.active_timers:
-            del bot.active_timers[timer_id]
-
 # --------- TIMERS LIST COMMAND ---------
 @bot.tree.command(name="timers", description="عرض جميع التايمرات النشطة")
+@timed("timers")
 async def timers_command(interaction: discord.Interaction):
     try:
-        user_timers = {k: v for k, v in bot.active_timers.items() if v['user'].id == interaction.user.id}
+        user_timers = dict(bot.active_timers.by_user(interaction.user.id))
+        
+        # Far-future timers parked in the database
+        scheduled = set()
+        for row in await get_scheduled_timers(user_id=interaction.user.id):
+            timer = Timer.from_row(row)
+            if timer.id not in user_timers:
+                user_timers[timer.id] = timer
+                scheduled.add(timer.id)
         
         if not user_timers:
             await interaction.response.send_message("🔭 ليس لديك أي تايمرات نشطة", ephemeral=True)
             return
         
-        theme_name = get_user_theme(interaction.user.id)
+        theme_name = await get_user_theme(interaction.user.id)
         theme = THEMES.get(theme_name, THEMES['dark'])
         
         embed = discord.Embed(
@@ -793,14 +3202,21 @@ async def timers_command(interaction: discord.Interaction):
             color=theme['color']
         )
         
-        for i, (timer_id, timer) in enumerate(user_timers.items(), 1):
-            remaining = int(timer['end_time'] - time.time())
-            status = "⏸️ متوقف" if timer.get('paused') else "▶️ يعمل"
+        for i, (timer_id, timer) in enumerate(list(user_timers.items())[:25], 1):
+            remaining = int(timer.end_time - time.time())
+            if timer.paused:
+                status = "⏸️ متوقف"
+            elif timer_id in scheduled:
+                status = "🗓️ مجدول"
+            else:
+                status = "▶️ يعمل"
             
-            created_ago = int(time.time() - timer['created_at'])
+            created_ago = int(time.time() - timer.created_at)
+            if timer.cycle:
+                status += f" - المرحلة {timer.cycle.phase + 1}/{timer.cycle.phases}"
             
             embed.add_field(
-                name=f"{i}. {timer['message'][:30] if timer['message'] else 'تايمر'}",
+                name=f"{i}. {timer.message[:30] if timer.message else 'تايمر'}",
                 value=f"{status} - متبقي: **{format_time(remaining)}**\nبدأ منذ: {format_time(created_ago)}",
                 inline=False
             )
@@ -824,9 +3240,10 @@ async def timers_command(interaction: discord.Interaction):
     app_commands.Choice(name="🌲 ثيم الغابة", value="forest"),
     app_commands.Choice(name="🌌 ثيم المجرة", value="galaxy"),
 ])
+@timed("theme")
 async def theme_command(interaction: discord.Interaction, theme_name: str):
     try:
-        # Save to database
+        # Queue the save; later reads are ordered after it
         set_user_theme(interaction.user.id, theme_name)
         
         theme = THEMES[theme_name]
@@ -848,28 +3265,48 @@ async def theme_command(interaction: discord.Interaction, theme_name: str):
         logger.error(traceback.format_exc())
         await interaction.response.send_message(f"❌ حدث خطأ: {str(e)}", ephemeral=True)
 
+# --------- DISPLAY COMMAND ---------
+@bot.tree.command(name="display", description="اختر طريقة عرض التايمر")
+@app_commands.describe(mode="طريقة العرض")
+@app_commands.choices(mode=[
+    app_commands.Choice(name="⏱️ الساعة الحية", value="live"),
+    app_commands.Choice(name="🕒 العد التنازلي المدمج", value="native"),
+])
+@timed("display")
+async def display_command(interaction: discord.Interaction, mode: str):
+    try:
+        set_user_display(interaction.user.id, mode)
+        
+        display = DISPLAY_MODES[mode]
+        theme = THEMES.get(await get_user_theme(interaction.user.id), THEMES['dark'])
+        
+        embed = discord.Embed(
+            title=f"{display['emoji']} تم تغيير طريقة العرض",
+            description=f"تم اختيار **{display['name']}**\n{display['description']}\n\nسيتم تطبيقها على التايمرات الجديدة",
+            color=theme['color']
+        )
+        
+        await interaction.response.send_message(embed=embed, ephemeral=True)
+        logger.info(f"User {interaction.user.name} changed display mode to {mode}")
+        
+    except Exception as e:
+        logger.error(f"Error in display command: {e}")
+        logger.error(traceback.format_exc())
+        await interaction.response.send_message(f"❌ حدث خطأ: {str(e)}", ephemeral=True)
+
 # --------- STATS COMMAND ---------
 @bot.tree.command(name="stats", description="عرض إحصائياتك")
+@timed("stats")
 async def stats_command(interaction: discord.Interaction):
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
         # Get user stats
-        cursor.execute('''
-            SELECT COUNT(*), SUM(duration), SUM(CASE WHEN completed THEN 1 ELSE 0 END)
-            FROM timer_history
-            WHERE user_id = ?
-        ''', (interaction.user.id,))
-        
-        total, total_time, completed = cursor.fetchone()
-        conn.close()
+        total, total_time, completed = await get_user_stats(interaction.user.id) or (0, 0, 0)
         
         if not total or total == 0:
             await interaction.response.send_message("📊 لم تستخدم التايمر بعد", ephemeral=True)
             return
         
-        theme_name = get_user_theme(interaction.user.id)
+        theme_name = await get_user_theme(interaction.user.id)
         theme = THEMES.get(theme_name, THEMES['dark'])
         
         embed = discord.Embed(
@@ -899,6 +3336,7 @@ async def stats_command(interaction: discord.Interaction):
 
 # --------- PING COMMAND ---------
 @bot.tree.command(name="ping", description="فحص سرعة البوت")
+@timed("ping")
 async def ping_command(interaction: discord.Interaction):
     try:
         latency = round(bot.latency * 1000)
@@ -931,6 +3369,7 @@ async def ping_command(interaction: discord.Interaction):
 
 # --------- HELP COMMAND ---------
 @bot.tree.command(name="help", description="عرض قائمة المساعدة")
+@timed("help")
 async def help_command(interaction: discord.Interaction):
     try:
         embed = discord.Embed(
@@ -941,7 +3380,13 @@ async def help_command(interaction: discord.Interaction):
         
         embed.add_field(
             name="/timer <المدة> [رسالة]",
-            value="ابدأ تايمر جديد\nمثال: `/timer 5m` أو `/timer 1h30m اذاكر`",
+            value="ابدأ تايمر جديد\nمثال: `/timer 5m` أو `/timer 1h30m اذاكر`\nللتكرار: `/timer 1h repeat:8` يذكّرك كل ساعة 8 مرات",
+            inline=False
+        )
+        
+        embed.add_field(
+            name="/pomodoro [work] [break] [rounds] [رسالة]",
+            value="دورة عمل واستراحة بالتناوب في رسالة واحدة\nمثال: `/pomodoro` = 4 جولات من 25 دقيقة عمل و5 دقائق استراحة",
             inline=False
         )
         
@@ -957,6 +3402,12 @@ async def help_command(interaction: discord.Interaction):
             inline=False
         )
         
+        embed.add_field(
+            name="/display <طريقة العرض>",
+            value="ساعة حية تتحدث باستمرار، أو عد تنازلي مدمج من Discord",
+            inline=False
+        )
+        
         embed.add_field(
             name="/stats",
             value="عرض إحصائياتك مع التايمر",
@@ -971,7 +3422,7 @@ async def help_command(interaction: discord.Interaction):
         
         embed.add_field(
             name="صيغ الوقت المدعومة:",
-            value="• `5m` = 5 دقائق\n• `2h` = ساعتين\n• `30s` = 30 ثانية\n• `1h30m` = ساعة ونصف",
+            value="• `5m` = 5 دقائق\n• `2h` = ساعتين\n• `30s` = 30 ثانية\n• `1h30m` = ساعة ونصف\n• `2d` = يومين\n• `٢٥ دقيقة` = 25 دقيقة",
             inline=False
         )
         
@@ -990,8 +3441,23 @@ async def help_command(interaction: discord.Interaction):
         logger.error(traceback.format_exc())
         await interaction.response.send_message(f"❌ حدث خطأ: {str(e)}", ephemeral=True)
 
+# --------- MAINTENANCE CLI ---------
+async def run_stats_check(repair):
+    await db.start()
+    try:
+        mismatches = await check_user_stats(repair=repair)
+        for user_id in mismatches[:50]:
+            logger.warning(f"user_stats mismatch for user {user_id}")
+    finally:
+        await db.close()
+
 # --------- RUN BOT ---------
 if __name__ == "__main__":
+    # python main.py --check-stats [--repair]
+    if '--check-stats' in sys.argv:
+        asyncio.run(run_stats_check(repair='--repair' in sys.argv))
+        sys.exit(0)
+    
     try:
         token = os.environ.get("TOKEN")
         